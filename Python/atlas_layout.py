@@ -0,0 +1,180 @@
+# Rectangle packers for the sprite atlas. Each one takes a list of (width, height) and returns an
+# (x, y) position for every rectangle in the same order, or None for any that do not fit.
+
+def shelf_pack(sizes, max_width, max_height=None):
+    """Left to right rows, each as tall as its tallest rectangle, rectangles sit on the bottom of their row."""
+    rows = []
+    row = []
+    row_width = 0
+    for i, (w, h) in enumerate(sizes):
+        if w > max_width:
+            continue
+        if row and row_width + w > max_width:
+            rows.append(row)
+            row = []
+            row_width = 0
+        row.append(i)
+        row_width += w
+    if row:
+        rows.append(row)
+
+    positions = [None] * len(sizes)
+    y = 0
+    for row in rows:
+        row_height = max(sizes[i][1] for i in row)
+        if max_height is not None and y + row_height > max_height:
+            break
+        x = 0
+        for i in row:
+            w, h = sizes[i]
+            positions[i] = (x, y + row_height - h)
+            x += w
+        y += row_height
+    return positions
+
+def skyline_pack(sizes, max_width, max_height=None):
+    """Bottom-left skyline, each rectangle goes where its top edge ends up lowest."""
+    skyline = [[0, 0, max_width]]  # x, y, width segments covering the whole width
+    positions = []
+    for w, h in sizes:
+        best = None
+        for i, (x, _, _) in enumerate(skyline):
+            if x + w > max_width:
+                break
+            y = 0
+            width_left = w
+            j = i
+            while width_left > 0:
+                y = max(y, skyline[j][1])
+                width_left -= skyline[j][2]
+                j += 1
+            if max_height is not None and y + h > max_height:
+                continue
+            if best is None or (y + h, x) < (best[1] + h, best[0]):
+                best = (x, y, i)
+        if best is None:
+            positions.append(None)
+            continue
+
+        x, y, i = best
+        positions.append((x, y))
+        skyline.insert(i, [x, y + h, w])
+        j = i + 1
+        while j < len(skyline) and skyline[j][0] < x + w:
+            seg_end = skyline[j][0] + skyline[j][2]
+            if seg_end <= x + w:
+                del skyline[j]
+            else:
+                skyline[j][2] = seg_end - (x + w)
+                skyline[j][0] = x + w
+                break
+        # Join neighbouring segments at the same height
+        j = 0
+        while j < len(skyline) - 1:
+            if skyline[j][1] == skyline[j + 1][1]:
+                skyline[j][2] += skyline[j + 1][2]
+                del skyline[j + 1]
+            else:
+                j += 1
+    return positions
+
+def _contains(outer, inner):
+    return (inner[0] >= outer[0] and inner[1] >= outer[1] and
+            inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+def maxrects_pack(sizes, max_width, max_height=None):
+    """MaxRects with the bottom-left rule, keeps every maximal free rectangle so gaps between sprites get reused."""
+    bin_height = max_height if max_height is not None else sum(h for _, h in sizes)
+    free = [(0, 0, max_width, bin_height)]
+    positions = []
+    for w, h in sizes:
+        best = None
+        for fx, fy, fw, fh in free:
+            if w <= fw and h <= fh and (best is None or (fy + h, fx) < (best[1] + h, best[0])):
+                best = (fx, fy)
+        if best is None:
+            positions.append(None)
+            continue
+
+        x, y = best
+        positions.append(best)
+        kept = []
+        split = []
+        for f in free:
+            fx, fy, fw, fh = f
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                kept.append(f)
+                continue
+            if x > fx:
+                split.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                split.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                split.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                split.append((fx, y + h, fw, fy + fh - y - h))
+        # Drop new free rectangles that sit inside another one, the old ones can't sit inside the new ones
+        pruned = []
+        for i, r in enumerate(split):
+            if any(_contains(o, r) for o in kept):
+                continue
+            if any(_contains(o, r) and (o != r or j < i) for j, o in enumerate(split) if j != i):
+                continue
+            pruned.append(r)
+        free = kept + pruned
+    return positions
+
+LAYOUTS = {
+    'shelf': shelf_pack,
+    'skyline': skyline_pack,
+    'maxrects': maxrects_pack,
+}
+
+# Packing order, always largest first
+SORT_KEYS = {
+    'none': None,
+    'height': lambda size: (size[1], size[0]),
+    'width': lambda size: (size[0], size[1]),
+    'area': lambda size: size[0] * size[1],
+    'maxside': lambda size: max(size),
+}
+
+def pack(sizes, layout='shelf', max_width=4096, max_height=None, sort='none'):
+    """Pack (width, height) rectangles, returns (positions, used_width, used_height).
+
+    positions keeps the order of sizes whatever sort is used, with None for rectangles that did not fit.
+    """
+    order = list(range(len(sizes)))
+    key = SORT_KEYS[sort]
+    if key is not None:
+        order.sort(key=lambda i: key(sizes[i]), reverse=True)
+    placed = LAYOUTS[layout]([sizes[i] for i in order], max_width, max_height)
+
+    positions = [None] * len(sizes)
+    used_width = used_height = 0
+    for i, pos in zip(order, placed):
+        if pos is None:
+            continue
+        positions[i] = pos
+        used_width = max(used_width, pos[0] + sizes[i][0])
+        used_height = max(used_height, pos[1] + sizes[i][1])
+    return positions, used_width, used_height
+
+def pack_pages(sizes, layout='shelf', page_width=4096, page_height=4096, sort='none'):
+    """Pack rectangles over as many fixed size pages as needed, returns a (page, x, y) or None for each one."""
+    placements = [None] * len(sizes)
+    remaining = list(range(len(sizes)))
+    page = 0
+    while remaining:
+        positions, _, _ = pack([sizes[i] for i in remaining], layout=layout, max_width=page_width, max_height=page_height, sort=sort)
+        left = []
+        for i, pos in zip(remaining, positions):
+            if pos is None:
+                left.append(i)
+            else:
+                placements[i] = (page, pos[0], pos[1])
+        if len(left) == len(remaining):
+            break  # the rest are bigger than a page
+        remaining = left
+        page += 1
+    return placements
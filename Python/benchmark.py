@@ -0,0 +1,200 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from build_roms import CODE_PARTS, SPRITE_PARTS, PALETTE_OFFSET, PALETTE_LENGTH
+from rom_utils import interleave, deinterleave
+from swapnybbles import swap_nibbles
+from palette5bit_to_8bit import convert_palette
+from sprite_decode import unpack_4bpp, render_rgba, render_image
+from sprite_table import SpriteTable
+from sprite_pack import write_pack, SpritePack
+from atlas_layout import LAYOUTS, pack
+from synthetic_rom import generate
+from sprite_zoom import ZOOM_ONE, zoom_batch
+
+# Differences smaller than this are timer noise, whatever the ratio
+NOISE_FLOOR = 0.001
+
+def best_time(func, repeat):
+    """Fastest of repeat runs of func() in seconds, and its result."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def merge_parts(roms, parts):
+    return b''.join(interleave([roms[name] for name in rom_names], byte_amount) for _, rom_names, byte_amount in parts)
+
+def reference_indices(sprite_bytes, xsize, ysize):
+    """unpack_4bpp the slow way, a pixel at a time, for checking it."""
+    plane = np.zeros((ysize, xsize), dtype=np.uint8)
+    for i in range(xsize * ysize):
+        byte = sprite_bytes[i // 2]
+        plane[i // xsize, i % xsize] = byte >> 4 if i % 2 == 0 else byte & 0x0F
+    return plane
+
+def check_outputs(roms, sprite_data, palette_rgb, rows, planes, zoomed):
+    """Check the benchmarked stages give the right answers, returns a list of what didn't.
+
+    planes are the unpack_4bpp planes and zoomed the zoom_batch planes at ZOOM_ONE, one per row,
+    so a change that makes a stage faster by getting it wrong fails the run rather than showing as a speedup.
+    """
+    failures = []
+    for parts in (CODE_PARTS, SPRITE_PARTS):
+        for _, rom_names, byte_amount in parts:
+            merged = interleave([roms[name] for name in rom_names], byte_amount)
+            if deinterleave(merged, len(rom_names), byte_amount) != [roms[name] for name in rom_names]:
+                failures.append(f"interleave/deinterleave round trip of {', '.join(rom_names)}")
+    if swap_nibbles(swap_nibbles(sprite_data)) != sprite_data:
+        failures.append("swap_nibbles twice is not the original data")
+
+    sprite_view = memoryview(sprite_data)
+    for row, plane, zoom_plane in zip(rows, planes, zoomed):
+        xsize, ysize, data_offset = int(row['xsize']), int(row['ysize']), int(row['data_offset'])
+        if not np.array_equal(plane, reference_indices(sprite_view[data_offset:], xsize, ysize)):
+            failures.append(f"unpack_4bpp of entry 0x{int(row['entry_offset']):05X} differs from the per-pixel reference")
+        if not np.array_equal(zoom_plane, plane):
+            failures.append(f"zoom 0x{ZOOM_ONE:X} of entry 0x{int(row['entry_offset']):05X} differs from the unzoomed plane")
+
+    palette_data = bytes(palette_rgb)
+    palette_count = len(palette_data) // (16 * 3)
+    sprites = [(int(row['entry_offset']), int(row['xsize']), int(row['ysize']), i % palette_count, int(row['data_offset']))
+               for i, row in enumerate(rows)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for bits in (8, 4):
+            path = os.path.join(tmp, f'check{bits}.pack')
+            write_pack(path, sprites, sprite_data, palette_data, bits=bits)
+            with SpritePack(path) as sprite_pack:
+                if len(sprite_pack) != len(sprites):
+                    failures.append(f"{bits}bpp pack holds {len(sprite_pack)} sprites, not {len(sprites)}")
+                    continue
+                for i, (plane, sprite) in enumerate(zip(planes, sprites)):
+                    palette = np.frombuffer(palette_data, dtype=np.uint8, count=16 * 3, offset=sprite[3] * 16 * 3).reshape(16, 3)
+                    if not np.array_equal(sprite_pack.indices(i), plane) or not np.array_equal(sprite_pack.palette(i), palette):
+                        failures.append(f"{bits}bpp pack round trip of entry 0x{sprite[0]:05X}")
+                        break
+    return failures
+
+def run_benchmarks(repeat=3, **options):
+    """Time each stage of the tools on a synthetic ROM set, returns {name: seconds} and the list of failed checks."""
+    roms, _ = generate(**options)
+    results = {}
+
+    results['merge'], code = best_time(lambda: merge_parts(roms, CODE_PARTS), repeat)
+    elapsed, sprite_data = best_time(lambda: merge_parts(roms, SPRITE_PARTS), repeat)
+    results['merge'] += elapsed
+    results['swap'], _ = best_time(lambda: swap_nibbles(sprite_data), repeat)
+    results['palette'], palette_rgb = best_time(lambda: convert_palette(code[PALETTE_OFFSET:PALETTE_OFFSET + PALETTE_LENGTH]), repeat)
+    results['table'], table = best_time(lambda: SpriteTable.from_rom(code), repeat)
+
+    rows = [row for row in table.pointers if row['xsize'] > 0]
+    sprite_view = memoryview(sprite_data)
+    palette = [tuple(palette_rgb[i * 3:i * 3 + 3]) for i in range(16)]
+
+    def decode():
+        return [render_rgba(unpack_4bpp(sprite_view[int(row['data_offset']):], int(row['xsize']), int(row['ysize'])), palette)
+                for row in rows]
+    results['decode'], _ = best_time(decode, repeat)
+    planes = [unpack_4bpp(sprite_view[int(row['data_offset']):], int(row['xsize']), int(row['ysize'])) for row in rows]
+
+    # Every sprite from 4 times magnified to a quarter size, as the road scenery is drawn
+    zooms = list(range(ZOOM_ONE // 4, ZOOM_ONE * 4 + 1, ZOOM_ONE // 4))
+
+    def zoom():
+        return [zoom_batch(sprite_view[int(row['data_offset']):], int(row['xsize']), int(row['ysize']), zooms) for row in rows]
+    results['zoom'], zoomed = best_time(zoom, repeat)
+    zoomed = [batch[zooms.index(ZOOM_ONE)] for batch in zoomed]
+
+    sizes = [(int(row['xsize']) + 16, int(row['ysize']) + 16) for row in rows]
+    for layout in LAYOUTS:
+        results[f'layout_{layout}'], packed = best_time(lambda: pack(sizes, layout=layout, max_width=2048, sort='height'), repeat)
+        if layout == 'shelf':
+            positions, width, height = packed
+
+    images = [render_image(plane, palette) for plane in planes]
+
+    def paste():
+        atlas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        for img, pos in zip(images, positions):
+            atlas.paste(img, pos)
+        return atlas
+    results['paste'], atlas = best_time(paste, repeat)
+
+    def encode():
+        atlas.save(io.BytesIO(), 'PNG')
+        for img in images:
+            img.save(io.BytesIO(), 'PNG')
+    results['png_encode'], _ = best_time(encode, repeat)
+
+    start = time.perf_counter()
+    failures = check_outputs(roms, sprite_data, palette_rgb, rows, planes, zoomed)
+    print(f"Checked the outputs in {time.perf_counter() - start:.2f} s")
+    return results, failures
+
+def compare(results, baseline, tolerance):
+    """Print each time against the baseline, returns the names that got slower by more than tolerance (and NOISE_FLOOR)."""
+    slower = []
+    print(f"{'benchmark':<16}{'ms':>10}{'baseline':>10}{'ratio':>8}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<16}{seconds * 1000:>10.2f}{'-':>10}")
+            continue
+        ratio = seconds / base if base else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance and seconds - base > NOISE_FLOOR:
+            flag = '  SLOWER'
+            slower.append(name)
+        print(f"{name:<16}{seconds * 1000:>10.2f}{base * 1000:>10.2f}{ratio:>8.2f}{flag}")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and time ROM merge, nibble swap, palette conversion, sprite decode and zoom, atlas layout/paste and PNG encode on a synthetic ROM set')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic ROMs (default: 1)')
+    parser.add_argument('--tables', type=int, default=150, help='Number of sprite tables (default: 150)')
+    parser.add_argument('--max-size', type=int, default=96, help='Largest sprite width and height (default: 96)')
+    parser.add_argument('--sprite-rom-size', type=lambda x: int(x, 0), default=0x20000, help='Size of each sprite ROM (default: 0x20000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark, the fastest is kept (default: 3)')
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a JSON file from --save-baseline, exits with 1 if anything got slower')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='How much slower than the baseline counts as a regression (default: 0.25 = 25%%)')
+    args = parser.parse_args()
+
+    options = {'seed': args.seed, 'tables': args.tables, 'max_size': min(args.max_size, 255), 'sprite_rom_size': args.sprite_rom_size}
+    results, failures = run_benchmarks(repeat=args.repeat, **options)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('options') != options:
+            print(f"Warning: the baseline was made with different options {baseline.get('options')}")
+        slower = compare(results, baseline['results'], args.tolerance)
+    else:
+        slower = []
+        for name, seconds in results.items():
+            print(f"{name:<16}{seconds * 1000:>10.2f} ms")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'options': options, 'results': results}, f, indent=1)
+        print(f"Baseline saved to {args.save_baseline}")
+    if failures:
+        print(f"{len(failures)} checks failed:")
+        for failure in failures:
+            print(f"  {failure}")
+    if slower:
+        print(f"Slower than the baseline: {', '.join(slower)}")
+    if failures or slower:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
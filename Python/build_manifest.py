@@ -0,0 +1,39 @@
+import hashlib
+import json
+import os
+
+CHUNK_SIZE = 1024 * 1024
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    """blake2b of a files contents, or None when it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def inputs_key(paths, options=()):
+    """One digest over the contents of the input files and the options they are used with."""
+    digest = hashlib.blake2b(repr(list(options)).encode(), digest_size=16)
+    for path in paths:
+        digest.update(f"{path}={file_digest(path)};".encode())
+    return digest.hexdigest()
+
+def load_manifest(path):
+    """The saved manifest dict, empty when there isn't one or it can't be read."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    # Written to the side first, so a build stopped half way can't leave a broken manifest
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
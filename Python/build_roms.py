@@ -0,0 +1,69 @@
+import argparse
+import os
+from rom_utils import interleave
+from swapnybbles import swap_nibbles
+from palette5bit_to_8bit import convert_palette
+
+# Each part is made by interleaving byte_amount sized chunks from its ROMs in the order listed,
+# the parts are then joined one after another. See mames segaorun.cpp for the order
+CODE_PARTS = [
+    ('code1.bin', ['epr-10380b.133', 'epr-10382b.118'], 1),
+    ('code2.bin', ['epr-10381b.132', 'epr-10383b.117'], 2),
+]
+SPRITE_PARTS = [
+    ('sprites1.bin', ['mpr-10377.12', 'mpr-10375.11', 'mpr-10373.10', 'mpr-10371.9'], 1),
+    ('sprites2.bin', ['mpr-10378.16', 'mpr-10376.15', 'mpr-10374.14', 'mpr-10372.13'], 1),
+]
+
+# The games 5-5-5 palettes inside code.bin
+PALETTE_OFFSET = 0x14ED8
+PALETTE_LENGTH = 0x2000
+
+def build_parts(rom_dir, parts, intermediates):
+    joined = bytearray()
+    for name, rom_names, byte_amount in parts:
+        buffers = []
+        for rom_name in rom_names:
+            with open(os.path.join(rom_dir, rom_name), 'rb') as f:
+                buffers.append(f.read())
+        part = interleave(buffers, byte_amount)
+        intermediates[name] = part
+        joined += part
+    return bytes(joined)
+
+def build_roms(rom_dir):
+    """Assemble every output from the ROM set in memory, returns (outputs, intermediates) dicts of filename: bytes."""
+    intermediates = {}
+    code = build_parts(rom_dir, CODE_PARTS, intermediates)
+    sprites = build_parts(rom_dir, SPRITE_PARTS, intermediates)
+    palettes = code[PALETTE_OFFSET:PALETTE_OFFSET + PALETTE_LENGTH]
+    outputs = {
+        'code.bin': code,
+        'outrun_palettes.bin': palettes,
+        'outrun16.pal': convert_palette(palettes),
+        'all_sprites.bin': sprites,
+        'swapped_all_sprites.bin': swap_nibbles(sprites),
+    }
+    return outputs, intermediates
+
+def write_files(files, output_dir):
+    for name, data in files.items():
+        with open(os.path.join(output_dir, name), 'wb') as f:
+            f.write(data)
+        print(f"Saved {len(data)} bytes to {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Build code.bin, the sprite binaries and palettes from the OutRun ROM set in one pass')
+    parser.add_argument('rom_dir', nargs='?', default='Rom', help='Folder with the unzipped ROM files (default: Rom)')
+    parser.add_argument('--output-dir', default='.', help='Folder to write the built files to (default: current folder)')
+    parser.add_argument('--keep-intermediate', action='store_true', help='Also write the code1/code2/sprites1/sprites2 parts')
+    args = parser.parse_args()
+
+    outputs, intermediates = build_roms(args.rom_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    write_files(outputs, args.output_dir)
+    if args.keep_intermediate:
+        write_files(intermediates, args.output_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import time
+from sprite_decode import render_indexed_image
+
+ENCODERS = ('png', 'indexed', 'raw')
+DEFAULT_PNG_LEVEL = 6  # the zlib level Pillow uses when it isn't given one
+
+# Palette for index planes that have no single palette of their own, like an atlas page
+GREY_PALETTE = [(i * 17, i * 17, i * 17) for i in range(16)]
+
+def page_filename(filename, page):
+    """name_000.ext style name for one page of a paged output."""
+    root, ext = os.path.splitext(filename)
+    return f"{root}_{page:03d}{ext}"
+
+class ImageWriter:
+    """Saves the tools output images in the chosen format, and adds up the time and bytes it took.
+
+    png      the usual images, with a zlib level (0-9) and optimize (which makes Pillow use level 9 and
+             try every filter, smallest and slowest)
+    indexed  index planes as uncompressed 'P' mode PNGs, colour 15 shown as 0 like -16
+    raw      index planes as headerless .bin files, one byte per pixel, row by row
+    """
+
+    def __init__(self, encoder='png', png_level=DEFAULT_PNG_LEVEL, png_optimize=False):
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown encoder {encoder}, use one of {', '.join(ENCODERS)}")
+        self.encoder = encoder
+        self.png_level = png_level
+        self.png_optimize = png_optimize
+        self.files = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.encoder, args.png_level, args.png_optimize)
+
+    @property
+    def extension(self):
+        return '.bin' if self.encoder == 'raw' else '.png'
+
+    @property
+    def key(self):
+        """Short name of the settings, for telling apart files saved with different ones."""
+        if self.encoder == 'png':
+            return f"png{self.png_level}{'o' if self.png_optimize else ''}"
+        return self.encoder
+
+    def check_filename(self, path):
+        """Warn when a name the user gave doesn't have the extension of what will be saved in it."""
+        if os.path.splitext(path)[1].lower() != self.extension:
+            print(f"Warning: {path} will hold {self.encoder} output, which is usually saved as {self.extension}")
+
+    def _png(self, image, path, compress_level, optimize=False):
+        start = time.perf_counter()
+        image.save(path, 'PNG', compress_level=compress_level, optimize=optimize)
+        return time.perf_counter() - start, os.path.getsize(path)
+
+    def write_image(self, image, path):
+        """Save a PIL image as a PNG with the level and optimize settings, returns (seconds, bytes)."""
+        return self._png(image, path, self.png_level, self.png_optimize)
+
+    def write_indices(self, indices, path, palette=None):
+        """Save a (height, width) index plane as an indexed PNG or raw bytes, returns (seconds, bytes)."""
+        if self.encoder == 'raw':
+            start = time.perf_counter()
+            with open(path, 'wb') as f:
+                f.write(indices.tobytes())
+            return time.perf_counter() - start, os.path.getsize(path)
+        return self._png(render_indexed_image(indices, palette or GREY_PALETTE), path, 0)
+
+    def add(self, seconds, size, files=1):
+        self.files += files
+        self.seconds += seconds
+        self.bytes += size
+
+    def summary(self):
+        return f"Encoded {self.files} files as {self.key}: {self.seconds:.2f}s, {self.bytes / (1024 * 1024):.2f} MB"
+
+def add_writer_arguments(parser):
+    parser.add_argument('--encoder', choices=ENCODERS, default='png',
+                        help='png: normal images, indexed: uncompressed indexed PNGs of the colour numbers, raw: .bin index planes (default: png)')
+    parser.add_argument('--png-level', type=int, choices=range(10), default=DEFAULT_PNG_LEVEL, metavar='0-9',
+                        help=f'zlib level for PNGs, 0 is fastest and largest (default: {DEFAULT_PNG_LEVEL})')
+    parser.add_argument('--png-optimize', action='store_true', help='Smallest PNGs, slowest to save')
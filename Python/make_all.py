@@ -0,0 +1,67 @@
+import argparse
+import glob
+import os
+import subprocess
+import sys
+from build_manifest import inputs_key, load_manifest, save_manifest
+from build_roms import CODE_PARTS, SPRITE_PARTS
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def build_stages(rom_dir):
+    """The make_all.bat steps as (name, script and arguments, input files, output files)."""
+    rom_files = [os.path.join(rom_dir, rom) for _, roms, _ in CODE_PARTS + SPRITE_PARTS for rom in roms]
+    tables = ['code.bin', 'all_sprites.bin', 'outrun16.pal']
+    return [
+        ('roms', ['build_roms.py', rom_dir], rom_files,
+         ['code.bin', 'outrun_palettes.bin', 'outrun16.pal', 'all_sprites.bin', 'swapped_all_sprites.bin']),
+        ('palette_image', ['palette_image2.py', '--columns', '3', 'outrun16.pal', 'outrun_palettes.png'],
+         ['outrun16.pal'], ['outrun_palettes.png']),
+        ('plot_index', ['sprite_plot_index.py', 'code.bin', 'all_sprites.bin', 'outrun16.pal', '51', '2', 'car1.png'],
+         tables, ['car1.png']),
+        ('atlas_variations', ['sprite_atlas.py', 'code.bin', 'all_sprites.bin', 'outrun16.pal', 'setup_table.csv', 'sprite_variations.png',
+                              '--overlay', 'sprite_variations_overlay.png', '--box', 'sprites_variations_box.png',
+                              '--variations', '--variations-cache', 'variations.csv'],
+         tables + ['setup_table.csv'], ['sprite_variations.png', 'sprite_variations_overlay.png', 'sprites_variations_box.png']),
+        ('atlas', ['sprite_atlas.py', 'code.bin', 'all_sprites.bin', 'outrun16.pal', 'setup_table.csv', 'sprite_.png',
+                   '--overlay', 'sprite_overlay.png', '--box', 'sprites_box.png'],
+         tables + ['setup_table.csv'], ['sprite_.png', 'sprite_overlay.png', 'sprites_box.png']),
+        # The extract steps are incremental themselves, only sprites that changed are saved again
+        ('sprites16col', ['sprites_extract.py', 'code.bin', 'all_sprites.bin', 'outrun16.pal', 'setup_table.csv', 'sprites16col',
+                          '--variations', '--variations-cache', 'variations.csv', '-16', '--incremental'],
+         tables + ['setup_table.csv'], [os.path.join('sprites16col', 'sprite_table.csv')]),
+        ('sprites256bit', ['sprites_extract.py', 'code.bin', 'all_sprites.bin', 'outrun16.pal', 'setup_table.csv', 'sprites256bit',
+                           '--variations', '--variations-cache', 'variations.csv', '--incremental'],
+         tables + ['setup_table.csv'], [os.path.join('sprites256bit', 'sprite_table.csv')]),
+    ]
+
+def run_stages(stages, manifest_file, force=False):
+    """Run each stage whose inputs, arguments or scripts changed since the last run, or whose outputs are missing."""
+    manifest = load_manifest(manifest_file)
+    # Any change to the tools themselves counts as a changed input for every stage
+    scripts = sorted(glob.glob(os.path.join(SCRIPT_DIR, '*.py')))
+    for name, command, inputs, outputs in stages:
+        key = inputs_key(inputs + scripts, command)
+        if not force and manifest.get(name) == key and all(os.path.exists(path) for path in outputs):
+            print(f"[{name}] up to date")
+            continue
+        print(f"[{name}] running {' '.join(command)}")
+        subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, command[0])] + command[1:], check=True)
+        manifest[name] = key
+        save_manifest(manifest_file, manifest)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the make_all.bat steps, skipping the ones whose inputs have not changed since the last run')
+    parser.add_argument('rom_dir', nargs='?', default='Rom', help='Folder with the unzipped ROM files (default: Rom)')
+    parser.add_argument('--manifest', default='build_manifest.json', help='Where the input hashes of each step are kept (default: build_manifest.json)')
+    parser.add_argument('--force', action='store_true', help='Run every step whether it is up to date or not')
+    args = parser.parse_args()
+
+    try:
+        run_stages(build_stages(args.rom_dir), args.manifest, force=args.force)
+    except subprocess.CalledProcessError as e:
+        print(f"Stopped, {e.cmd[1]} failed with exit code {e.returncode}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,21 @@
 import sys
+from rom_utils import interleave
 
-def merge_binaries(file1_path, file2_path, output_path, byte_amount):
-    with open(file1_path, 'rb') as file1, open(file2_path, 'rb') as file2, open(output_path, 'wb') as output:
-        while True:
-            chunk1 = file1.read(byte_amount)
-            chunk2 = file2.read(byte_amount)
-            if not chunk1 or not chunk2:
-                break
-            output.write(chunk1 + chunk2)
+def merge_binaries(input_paths, output_path, byte_amount):
+    buffers = []
+    for path in input_paths:
+        with open(path, 'rb') as f:
+            buffers.append(f.read())
+    with open(output_path, 'wb') as output:
+        output.write(interleave(buffers, byte_amount))
 
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Usage: python merge_binaries.py <input1.bin> <input2.bin> <output.bin> <byte_amount>")
+    if len(sys.argv) < 5:
+        print("Usage: python merge_binaries.py <input1.bin> <input2.bin> [<input3.bin> ...] <output.bin> <byte_amount>")
         sys.exit(1)
-    
-    file1_path = sys.argv[1]
-    file2_path = sys.argv[2]
-    output_path = sys.argv[3]
-    byte_amount = int(sys.argv[4])
 
-    merge_binaries(file1_path, file2_path, output_path, byte_amount)
+    input_paths = sys.argv[1:-2]
+    output_path = sys.argv[-2]
+    byte_amount = int(sys.argv[-1])
 
+    merge_binaries(input_paths, output_path, byte_amount)
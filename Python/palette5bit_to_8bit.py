@@ -1,4 +1,6 @@
 import sys
+import numpy as np
+from rom_access import map_file
 
 def pal5bit(val):
     """Convert a 5-bit value (0-31) to 8-bit (0-255) as in MAME."""
@@ -11,6 +13,35 @@ def sega16_palette_decode(word):
     b = ((word >> 14) & 0x01) | ((word >> 7) & 0x1e)
     return pal5bit(r), pal5bit(g), pal5bit(b)
 
+# RGB for every possible palette word, so a whole palette dump converts with one table lookup
+WORD_TO_RGB = np.stack(sega16_palette_decode(np.arange(0x10000, dtype=np.uint32)), axis=1).astype(np.uint8)
+
+def decode_palette_words(data):
+    """Convert big endian 5-5-5 palette words to an (n, 3) array of 8-bit RGB."""
+    words = np.frombuffer(data, dtype='>u2', count=len(data) // 2)
+    return WORD_TO_RGB[words]
+
+def convert_palette(data):
+    """Convert big endian 5-5-5 palette words to packed 8-bit RGB bytes."""
+    return decode_palette_words(data).tobytes()
+
+def load_palette_file(palette_file, raw=False):
+    """8-bit RGB bytes of a palette file, converted from raw 5-5-5 palette RAM when raw is set.
+
+    Palette files are a few KB, so they are copied out and the map closed straight away.
+    """
+    with map_file(palette_file) as data:
+        return convert_palette(data) if raw else bytes(data)
+
+def read_palette(palette_bin, palette_num):
+    """The 16 (r, g, b) colours of a palette number in 8-bit RGB palette bytes."""
+    palette_count = len(palette_bin) // (16 * 3)
+    if not 0 <= palette_num < palette_count:
+        raise ValueError(f"Palette {palette_num:X} is not in the palette file, which has {palette_count} palettes (0-{palette_count - 1:X})")
+    palette_offset = palette_num * 16 * 3
+    palette_bytes = palette_bin[palette_offset:palette_offset + 16 * 3]
+    return [(palette_bytes[i*3], palette_bytes[i*3+1], palette_bytes[i*3+2]) for i in range(16)]
+
 def main():
     if len(sys.argv) < 3:
         print(f"Usage: {sys.argv[0]} input.bin output.pal")
@@ -19,15 +50,8 @@ def main():
     infile = sys.argv[1]
     outfile = sys.argv[2]
 
-    rgb_bytes = bytearray()
-    with open(infile, "rb") as f:
-        while True:
-            bytes2 = f.read(2)
-            if len(bytes2) < 2:
-                break
-            word = int.from_bytes(bytes2, "big")
-            r, g, b = sega16_palette_decode(word)
-            rgb_bytes.extend([r, g, b])
+    with map_file(infile) as data:
+        rgb_bytes = convert_palette(data)
 
     with open(outfile, "wb") as f:
         f.write(rgb_bytes)
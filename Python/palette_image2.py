@@ -1,27 +1,27 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import sys
 import os
 import argparse
 import math
+import numpy as np
+from palette5bit_to_8bit import load_palette_file
+from profiling import Profiler, add_profile_arguments
+from text_labels import LabelRenderer, load_font
 
-def load_palettes(input_file, n_colors):
-    with open(input_file, "rb") as f:
-        data = f.read()
+def load_palettes(input_file, n_colors, raw=False):
+    """(n_palettes, n_colors, 3) array of the RGB palettes in a file."""
+    data = load_palette_file(input_file, raw=raw)
     if len(data) % (n_colors*3) != 0:
         raise ValueError(f"Input size is not a multiple of {n_colors*3} (colors × 3 bytes)")
-    n_palettes = len(data) // (n_colors*3)
-    palettes = []
-    for p in range(n_palettes):
-        base = p * n_colors * 3
-        palette = []
-        for c in range(n_colors):
-            off = base + c * 3
-            r, g, b = data[off], data[off+1], data[off+2]
-            palette.append((r, g, b))
-        palettes.append(palette)
-    return palettes
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, n_colors, 3)
 
-def main(input_file, output_file, columns):
+def parse_range(text):
+    """Palette numbers from a hex range like 10-1F (inclusive) or a single 3A."""
+    first, _, last = text.partition('-')
+    return range(int(first, 16), int(last or first, 16) + 1)
+
+def main(input_file, output_file, columns, profiler=None, ranges=None, diff_file=None, raw=False):
+    profiler = profiler or Profiler('palette_image2')
     n_colors = 16
     img_width = 3840
     padding_top = 80
@@ -34,63 +34,79 @@ def main(input_file, output_file, columns):
     block_width = usable_width // columns
     swatch_size = (block_width - index_width) // n_colors
 
-    palettes = load_palettes(input_file, n_colors)
-    n_palettes = len(palettes)
-    n_rows = math.ceil(n_palettes / columns)
+    with profiler.stage('load'):
+        palettes = load_palettes(input_file, n_colors, raw=raw)
+        numbers = np.arange(len(palettes))
+        if ranges:
+            numbers = np.unique(np.concatenate([np.asarray(r) for r in ranges]))
+            numbers = numbers[numbers < len(palettes)]
+        # With a diff the top half of each swatch is the input colour and the bottom half the other files,
+        # and only palettes that differ are shown
+        bottom = palettes[numbers]
+        if diff_file:
+            other = load_palettes(diff_file, n_colors, raw=raw)
+            numbers = numbers[numbers < len(other)]
+            bottom = other[numbers]
+            changed = np.any(palettes[numbers] != bottom, axis=(1, 2))
+            print(f"{int(changed.sum())} of {len(numbers)} palettes differ, {int(np.any(palettes[numbers] != bottom, axis=2).sum())} colours")
+            numbers = numbers[changed]
+            bottom = bottom[changed]
+        top = palettes[numbers]
+    n_palettes = len(numbers)
+    n_rows = max(math.ceil(n_palettes / columns), 1)
 
     # Font sizes
     font_hex_sz = int(swatch_size * 0.65)
     font_dec_sz = int(swatch_size * 0.35)
     font_top_sz = int(swatch_size * 0.38)
-
-    try:
-        font_hex = ImageFont.truetype("arial.ttf", font_hex_sz)
-        font_dec = ImageFont.truetype("arial.ttf", font_dec_sz)
-        font_top = ImageFont.truetype("arial.ttf", font_top_sz)
-    except IOError:
-        font_hex = ImageFont.load_default()
-        font_dec = ImageFont.load_default()
-        font_top = ImageFont.load_default()
+    glyphs_hex = LabelRenderer(load_font(font_hex_sz))
+    glyphs_dec = LabelRenderer(load_font(font_dec_sz))
+    glyphs_top = LabelRenderer(load_font(font_top_sz))
+    hex_bbox = glyphs_hex.font.getbbox("0123456789ABCDEF$")
+    hex_height = hex_bbox[3] - hex_bbox[1]
 
     block_height = swatch_size
     img_height = padding_top + n_rows * block_height + row_gap * (n_rows - 1) + extra_bottom  # <--- Add here
 
-    img = Image.new("RGB", (img_width, img_height), "white")
-    draw = ImageDraw.Draw(img)
-
-    # Draw color numbers at the top of each block
-    for col in range(columns):
-        x0 = col * (block_width + col_gap)
-        for c in range(n_colors):
-            xx = x0 + index_width + c * swatch_size + swatch_size // 2
-            y = padding_top // 2 - font_top_sz // 2
-            label = f"{c:X}"
-            bbox = draw.textbbox((0,0), label, font=font_top)
-            w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-            draw.text((xx - w//2, y), label, fill="black", font=font_top)
+    with profiler.stage('draw'):
+        # Rows are block_height + row_gap apart, so the rows of a column are a reshape of the image rows.
+        # The extra row_gap at the bottom lets the last row reshape too, it's cropped off again
+        grid = np.full((img_height + row_gap, img_width, 3), 255, dtype=np.uint8)
+        rows = grid[padding_top:padding_top + n_rows * (block_height + row_gap)].reshape(n_rows, block_height + row_gap, img_width, 3)
+        half = swatch_size // 2 if diff_file else swatch_size
+        for col in range(columns):
+            col_top = top[col * n_rows:(col + 1) * n_rows]
+            col_bottom = bottom[col * n_rows:(col + 1) * n_rows]
+            x = col * (block_width + col_gap) + index_width
+            # (palettes, 16, 3) to one line of swatch pixels per palette, then down the swatch height
+            rows[:len(col_top), :half, x:x + n_colors * swatch_size] = np.repeat(col_top, swatch_size, axis=1)[:, None]
+            rows[:len(col_bottom), half:swatch_size, x:x + n_colors * swatch_size] = np.repeat(col_bottom, swatch_size, axis=1)[:, None]
+        img = Image.fromarray(grid[:img_height])
 
-    # Draw palettes
-    for i, palette in enumerate(palettes):
-        block_col = i // n_rows
-        block_row = i % n_rows
-        x0 = block_col * (block_width + col_gap)
-        y0 = padding_top + block_row * (block_height + row_gap)
+    with profiler.stage('labels'):
+        # Draw color numbers at the top of each block
+        for col in range(columns):
+            x0 = col * (block_width + col_gap)
+            for c in range(n_colors):
+                xx = x0 + index_width + c * swatch_size + swatch_size // 2
+                y = padding_top // 2 - font_top_sz // 2
+                label = f"{c:X}"
+                glyphs_top.paste(img, (xx - glyphs_top.width(label)//2, y), label)
 
         # Palette index (hex & decimal)
-        hex_txt = f"${i:02X}"
-        dec_txt = f"{i:3d}"
-        bbox_hex = draw.textbbox((0,0), hex_txt, font=font_hex)
-        w_hex, h_hex = bbox_hex[2] - bbox_hex[0], bbox_hex[3] - bbox_hex[1]
-        bbox_dec = draw.textbbox((0,0), dec_txt, font=font_dec)
-        w_dec, h_dec = bbox_dec[2] - bbox_dec[0], bbox_dec[3] - bbox_dec[1]
-        draw.text((x0 + index_width//2 - w_hex//2, y0 + 5), hex_txt, fill="black", font=font_hex)
-        draw.text((x0 + index_width//2 - w_dec//2, y0 + 7 + h_hex), dec_txt, fill="black", font=font_dec)
-        for c in range(n_colors):
-            color = palette[c]
-            x = x0 + index_width + c * swatch_size
-            draw.rectangle([x, y0, x + swatch_size - 1, y0 + swatch_size - 1], fill=color)
+        for i, number in enumerate(numbers):
+            block_col = i // n_rows
+            block_row = i % n_rows
+            x0 = block_col * (block_width + col_gap)
+            y0 = padding_top + block_row * (block_height + row_gap)
+            hex_txt = f"${number:02X}"
+            dec_txt = f"{number:3d}"
+            glyphs_hex.paste(img, (x0 + index_width//2 - glyphs_hex.width(hex_txt)//2, y0 + 5), hex_txt)
+            glyphs_dec.paste(img, (x0 + index_width//2 - glyphs_dec.width(dec_txt)//2, y0 + 7 + hex_height), dec_txt)
 
-    img.save(output_file)
+    with profiler.stage('save'):
+        img.save(output_file)
+    profiler.count('draw', pixels=n_palettes * n_colors * swatch_size * swatch_size)
     print(f"Saved: {output_file}")
 
 if __name__ == "__main__":
@@ -98,5 +114,11 @@ if __name__ == "__main__":
     parser.add_argument("input_file", help="Binary palette file")
     parser.add_argument("output_file", help="Output PNG filename")
     parser.add_argument("--columns", type=int, default=1, help="Number of columns (default: 1)")
+    parser.add_argument("--range", dest="ranges", action="append", type=parse_range, help="Only these palettes, hex and inclusive e.g. 10-1F, can be given more than once")
+    parser.add_argument("--diff", help="Second palette file, shows only the palettes that differ with this files colours in the bottom half of each swatch")
+    parser.add_argument("--raw-palette", action="store_true", help="The palette files are raw 5-5-5 palette RAM (e.g. outrun_palettes.bin) rather than 8-bit RGB")
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    main(args.input_file, args.output_file, args.columns)
+    profiler = Profiler.from_args('palette_image2', args)
+    main(args.input_file, args.output_file, args.columns, profiler=profiler, ranges=args.ranges, diff_file=args.diff, raw=args.raw_palette)
+    profiler.close()
@@ -0,0 +1,189 @@
+import argparse
+import csv
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from sprite_decode import unpack_4bpp, TRANSPARENT_INDICES
+from palette5bit_to_8bit import load_palette_file
+from sprite_table import load_sprite_table, load_sprite_csv
+from rom_access import map_file, read_view
+from profiling import Profiler, add_profile_arguments
+from image_writer import page_filename
+
+# Every palette is scored against a sprite from two counts of its index plane, so no palette is ever rendered
+# to score it:
+#   smoothness  1 - the mean RGB distance between neighbouring opaque pixels of different colour numbers,
+#               taken from a 16x16 count of which numbers sit next to each other
+#   distinct    how many different colours the numbers the sprite uses come out as, over how many it uses,
+#               so palettes that turn the sprite into a few flat colours (or all black) score low
+# score = smoothness * distinct. Only the best palettes are rendered, for the contact sheet.
+SHEET_BACKGROUND = (48, 48, 48, 255)
+
+def palette_luts(palettes):
+    """(n, 16, 4) RGBA lookup tables for every palette, colours 0/15 transparent like palette_lut."""
+    luts = np.zeros((len(palettes), 16, 4), dtype=np.uint8)
+    luts[:, :, :3] = palettes
+    luts[:, :, 3] = 255
+    luts[:, list(TRANSPARENT_INDICES)] = 0
+    return luts
+
+def palette_distances(palettes):
+    """(n, 256) RGB distance between every pair of colour numbers of each palette, 0 to 1."""
+    colours = palettes.astype(np.int16)
+    return (np.abs(colours[:, :, None] - colours[:, None, :]).sum(axis=3) / (255 * 3)).reshape(len(palettes), 256)
+
+def colour_codes(palettes):
+    """(n, 16) colours packed into one int each, for counting distinct ones."""
+    colours = palettes.astype(np.int32)
+    return (colours[:, :, 0] << 16) | (colours[:, :, 1] << 8) | colours[:, :, 2]
+
+def score_palettes(indices, distances, codes):
+    """(score, smoothness, distinct) arrays with one value per palette for a (ysize, xsize) index plane."""
+    opaque = ~np.isin(indices, TRANSPARENT_INDICES)
+    pairs = []
+    for a, b, both in ((indices[:, :-1], indices[:, 1:], opaque[:, :-1] & opaque[:, 1:]),
+                       (indices[:-1], indices[1:], opaque[:-1] & opaque[1:])):
+        both &= a != b
+        pairs.append(a[both].astype(np.int32) * 16 + b[both])
+    pairs = np.bincount(np.concatenate(pairs), minlength=256)
+    if pairs.sum():
+        smoothness = 1 - distances @ pairs / pairs.sum()
+    else:
+        smoothness = np.ones(len(distances))
+
+    used = np.unique(indices[opaque])
+    if len(used):
+        used_codes = np.sort(codes[:, used], axis=1)
+        distinct = (1 + np.count_nonzero(np.diff(used_codes, axis=1), axis=1)) / len(used)
+    else:
+        distinct = np.zeros(len(codes))
+    return smoothness * distinct, smoothness, distinct
+
+def sweep_sprites(sprite_table, sprite_data, palettes, entry_offsets, top=8):
+    """(entry_offset, xsize, ysize, indices, best palettes, their scores) for each entry, best first."""
+    distances = palette_distances(palettes)
+    codes = colour_codes(palettes)
+    results = []
+    scored = {}
+    for entry_offset in entry_offsets:
+        try:
+            xsize, ysize, data_offset = sprite_table.sprite_entry(entry_offset)
+            if xsize == 0 or ysize == 0:
+                continue
+            key = (data_offset, xsize, ysize)
+            if key not in scored:
+                indices = unpack_4bpp(read_view(sprite_data, data_offset, (xsize * ysize + 1) // 2), xsize, ysize)
+                score, _, _ = score_palettes(indices, distances, codes)
+                # Stable sort so equal palettes keep their number order
+                best = np.argsort(-score, kind='stable')[:top]
+                scored[key] = (indices, best, score[best])
+            results.append((entry_offset, xsize, ysize) + scored[key])
+        except Exception as e:
+            print(f"Skipping code offset {entry_offset:X}: {str(e)}")
+    return results
+
+def render_sheet(results, luts, cell_size=96, label_height=12, name_width=56):
+    """Contact sheet, a row per sprite with its best palettes left to right, each labelled with palette and score."""
+    columns = max((len(best) for _, _, _, _, best, _ in results), default=0)
+    sheet = Image.new('RGBA', (name_width + columns * cell_size, len(results) * (cell_size + label_height)), SHEET_BACKGROUND)
+    draw = ImageDraw.Draw(sheet)
+    font = ImageFont.load_default()
+    for row, (entry_offset, xsize, ysize, indices, best, scores) in enumerate(results):
+        y = row * (cell_size + label_height)
+        draw.text((2, y + cell_size // 2), f"{entry_offset:05X}", fill=(255, 255, 255, 255), font=font)
+        # The best palettes all applied to the plane in one gather, (palettes, ysize, xsize, 4)
+        images = luts[best][:, indices]
+        scale = min(1.0, cell_size / max(xsize, ysize))
+        size = (max(1, int(xsize * scale)), max(1, int(ysize * scale)))
+        for col, (palette_num, score) in enumerate(zip(best, scores)):
+            img = Image.fromarray(images[col])
+            if scale < 1:
+                img = img.resize(size, Image.NEAREST)
+            x = name_width + col * cell_size
+            sheet.alpha_composite(img, (x + (cell_size - size[0]) // 2, y + (cell_size - size[1]) // 2))
+            draw.text((x + 2, y + cell_size), f"{palette_num:02x} {score:.2f}", fill=(255, 255, 255, 255), font=font)
+    return sheet
+
+def palette_sweep(code_bin, sprite_bin, palette_bin, entries, sheet_file, suggest_file, scores_file=None, raw_palette=False,
+                  table_index=None, top=8, suggest=3, rows_per_sheet=40, cell_size=96, profiler=None):
+    """entries are (entry_offset, known palettes) like load_sprite_csv gives, the known palettes are only used for the report."""
+    profiler = profiler or Profiler('palette_sweep')
+    with profiler.stage('load'):
+        sprite_table = load_sprite_table(code_bin, table_index)
+        sprite_file = map_file(sprite_bin)
+        palettes = np.frombuffer(load_palette_file(palette_bin, raw=raw_palette), dtype=np.uint8)
+        palettes = palettes[:len(palettes) // 48 * 48].reshape(-1, 16, 3)
+
+    with profiler.stage('score'):
+        results = sweep_sprites(sprite_table, sprite_file.data, palettes, [entry_offset for entry_offset, _ in entries], top)
+    sprite_table.close()
+    sprite_file.close()
+    profiler.count('score', len(results), sum(xsize * ysize * len(palettes) for _, xsize, ysize, _, _, _ in results))
+    print(f"Scored {len(results)} sprites against {len(palettes)} palettes")
+
+    with profiler.stage('save'):
+        with open(suggest_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Hex off', 'Palette'])
+            for entry_offset, _, _, _, best, _ in results:
+                writer.writerow([f"{entry_offset:05X}"] + [f"{p:02x}" for p in best[:suggest]])
+        print(f"Suggested rows written to {suggest_file}")
+        if scores_file:
+            with open(scores_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['entry_offset', 'rank', 'palette', 'score'])
+                for entry_offset, _, _, _, best, scores in results:
+                    for rank, (p, score) in enumerate(zip(best, scores)):
+                        writer.writerow([f"{entry_offset:05X}", rank + 1, f"{p:02x}", f"{score:.4f}"])
+            print(f"Scores written to {scores_file}")
+
+    with profiler.stage('sheet'):
+        luts = palette_luts(palettes)
+        pages = range(0, len(results), rows_per_sheet)
+        for page, start in enumerate(pages):
+            sheet = render_sheet(results[start:start + rows_per_sheet], luts, cell_size)
+            path = page_filename(sheet_file, page) if len(pages) > 1 else sheet_file
+            sheet.save(path)
+        print(f"Contact sheet saved to {page_filename(sheet_file, 0) if len(pages) > 1 else sheet_file}"
+              + (f" and {len(pages) - 1} more pages" if len(pages) > 1 else ""))
+
+    known = {entry_offset: palette_nums for entry_offset, palette_nums in entries if palette_nums}
+    checked = [(best[:suggest], known[entry_offset]) for entry_offset, _, _, _, best, _ in results if entry_offset in known]
+    if checked:
+        found = sum(1 for best, palette_nums in checked if set(best.tolist()) & set(palette_nums))
+        print(f"A palette from the CSV is in the top {suggest} for {found} of {len(checked)} sprites")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Score every palette against sprites and suggest the likeliest ones, with a contact sheet of the best')
+    parser.add_argument('code_bin', help='Game code binary (with pointer and dimension tables)')
+    parser.add_argument('sprite_bin', help='Sprite data binary')
+    parser.add_argument('palette_bin', help='Palette binary')
+    parser.add_argument('--csv', help='setup_table.csv style file of the entry offsets to sweep, any palettes in it are compared with the suggestions')
+    parser.add_argument('--entry', action='append', type=lambda x: int(x, 16), default=[], help='Entry offset (hex) to sweep, can be given more than once')
+    parser.add_argument('--sheet', default='palette_sweep.png', help='Contact sheet PNG, numbered when there is more than one page (default: palette_sweep.png)')
+    parser.add_argument('--suggest-csv', default='palette_suggestions.csv', help='setup_table.csv rows with the suggested palettes (default: palette_suggestions.csv)')
+    parser.add_argument('--scores', help='CSV of the score of every palette on the sheet')
+    parser.add_argument('--top', type=int, default=8, help='Palettes shown per sprite on the sheet (default: 8)')
+    parser.add_argument('--suggest', type=int, default=3, help='Palettes per suggested row (default: 3)')
+    parser.add_argument('--rows-per-sheet', type=int, default=40, help='Sprites per contact sheet page (default: 40)')
+    parser.add_argument('--cell-size', type=int, default=96, help='Contact sheet cell size, larger sprites are scaled down (default: 96)')
+    parser.add_argument('--raw-palette', action='store_true', help='palette_bin is raw 5-5-5 palette RAM (e.g. outrun_palettes.bin) rather than 8-bit RGB')
+    parser.add_argument('--table-index', help='Saved sprite table index (.npy) to use instead of parsing the ROM, made from the ROM if it does not exist yet')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    entries = load_sprite_csv(args.csv) if args.csv else []
+    entries += [(entry_offset, []) for entry_offset in args.entry]
+    if not entries:
+        # Every sprite in the pointer table
+        table = load_sprite_table(args.code_bin, args.table_index)
+        entries = [(int(entry_offset), []) for entry_offset in np.unique(table.pointers['entry_offset'])]
+        table.close()
+
+    profiler = Profiler.from_args('palette_sweep', args)
+    palette_sweep(args.code_bin, args.sprite_bin, args.palette_bin, entries, args.sheet, args.suggest_csv, args.scores,
+                  args.raw_palette, args.table_index, max(args.top, args.suggest), args.suggest, args.rows_per_sheet, args.cell_size, profiler)
+    profiler.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import cProfile
+import heapq
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class Profiler:
+    """Stage timings for --profile, written out as a JSON report, plus an optional cProfile dump.
+
+    Each stage keeps its total wall time, how many times it ran and the sprites and pixels it handled.
+    With memory, it also keeps the peak Python memory (tracemalloc) while it ran. Tracing slows every
+    allocation, so it is off unless asked for and the wall times are not skewed by it. Stages are not
+    nested. A profiler made with neither file does nothing, so the tools can always call it.
+    """
+
+    def __init__(self, tool, report_file=None, cprofile_file=None, slowest=10, memory=False):
+        self.tool = tool
+        self.report_file = report_file
+        self.cprofile_file = cprofile_file
+        self.slowest = slowest
+        self.enabled = report_file is not None
+        self.memory = self.enabled and memory
+        self.stages = {}
+        self.slowest_sprites = []  # min heap of (seconds, label, pixels)
+        self.start = time.perf_counter()
+        if self.memory:
+            tracemalloc.start()
+        self.cprofile = None
+        if cprofile_file:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @classmethod
+    def from_args(cls, tool, args):
+        return cls(tool, args.profile, args.cprofile, args.profile_slowest, args.profile_memory)
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {'wall_seconds': 0.0, 'calls': 0, 'sprites': 0, 'pixels': 0, 'peak_bytes': 0 if self.memory else None})
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self._stage(name)
+            stage['wall_seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+            if self.memory:
+                stage['peak_bytes'] = max(stage['peak_bytes'], tracemalloc.get_traced_memory()[1])
+
+    def count(self, name, sprites=0, pixels=0):
+        if self.enabled:
+            stage = self._stage(name)
+            stage['sprites'] += sprites
+            stage['pixels'] += pixels
+
+    def sprite(self, name, label, seconds, pixels):
+        """Count one sprite against a stage and keep it if it's one of the slowest."""
+        if not self.enabled:
+            return
+        self.count(name, 1, pixels)
+        item = (seconds, label, pixels)
+        if len(self.slowest_sprites) < self.slowest:
+            heapq.heappush(self.slowest_sprites, item)
+        elif item > self.slowest_sprites[0]:
+            heapq.heapreplace(self.slowest_sprites, item)
+
+    def report(self):
+        stages = self.stages.values()
+        return {
+            'tool': self.tool,
+            'wall_seconds': time.perf_counter() - self.start,
+            'peak_bytes': tracemalloc.get_traced_memory()[1] if self.memory else None,
+            'sprites': sum(stage['sprites'] for stage in stages),
+            'pixels': sum(stage['pixels'] for stage in stages),
+            'stages': self.stages,
+            'slowest_sprites': [{'sprite': label, 'seconds': seconds, 'pixels': pixels}
+                                for seconds, label, pixels in sorted(self.slowest_sprites, reverse=True)],
+        }
+
+    def close(self):
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_file)
+            print(f"cProfile stats saved to {self.cprofile_file}")
+        if self.enabled:
+            report = self.report()
+            if self.memory:
+                tracemalloc.stop()
+            with open(self.report_file, 'w') as f:
+                json.dump(report, f, indent=1)
+            print(f"Profile report saved to {self.report_file}")
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', metavar='REPORT_JSON', help='Write a JSON report of the time and sprites of each stage')
+    parser.add_argument('--profile-memory', action='store_true', help='Also trace the peak Python memory of each stage in the --profile report (slows the run)')
+    parser.add_argument('--cprofile', metavar='STATS_FILE', help='Write cProfile stats (for pstats or snakeviz)')
+    parser.add_argument('--profile-slowest', type=int, default=10, help='How many of the slowest sprites go in the --profile report (default: 10)')
@@ -0,0 +1,46 @@
+import mmap
+import os
+
+# code.bin, all_sprites.bin and the palette files are opened as read only memory maps rather than read into
+# bytes. Slices of the memoryviews handed out here are views too, so entries, sprite pixels and palettes are
+# read straight out of the OS page cache, and every tool process working on the same ROM set shares it.
+
+class MappedFile:
+    """Read only memory map of a whole file, data is a memoryview of it (an empty one for an empty file).
+
+    Close it, or use it as a with block that gives the data, once it's done with. On Windows a file that is
+    still mapped can't be overwritten or deleted, which stops a rebuild of the ROM files. A map that still
+    has views of it held elsewhere closes when the last of them goes instead.
+    """
+
+    def __init__(self, path):
+        self.map = None
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.map if self.map is not None else b'')
+
+    def __enter__(self):
+        return self.data
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self.data.release()
+            if self.map is not None:
+                self.map.close()
+        except BufferError:
+            pass
+        self.map = None
+
+def map_file(path):
+    """A MappedFile of path, the caller closes it."""
+    return MappedFile(path)
+
+def read_view(data, offset, length):
+    """length bytes at offset as a view, ValueError if the data runs out first."""
+    if offset < 0 or offset + length > len(data):
+        raise ValueError(f"Data too short: have {max(len(data) - offset, 0)} bytes at 0x{offset:X}, need {length}")
+    return memoryview(data)[offset:offset + length]
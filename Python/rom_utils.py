@@ -0,0 +1,15 @@
+import numpy as np
+
+def interleave(buffers, byte_amount):
+    """Interleave byte_amount sized chunks from each buffer in turn, stopping at the end of the shortest one."""
+    chunks = min(len(buf) for buf in buffers) // byte_amount
+    merged = np.empty((chunks, len(buffers), byte_amount), dtype=np.uint8)
+    for i, buf in enumerate(buffers):
+        merged[:, i, :] = np.frombuffer(buf, dtype=np.uint8, count=chunks * byte_amount).reshape(chunks, byte_amount)
+    return merged.tobytes()
+
+def deinterleave(data, count, byte_amount):
+    """Split data back into count buffers of byte_amount sized chunks, the reverse of interleave."""
+    chunks = len(data) // (count * byte_amount)
+    split = np.frombuffer(data, dtype=np.uint8, count=chunks * count * byte_amount).reshape(chunks, count, byte_amount)
+    return [split[:, i, :].tobytes() for i in range(count)]
@@ -1,4 +1,5 @@
 import sys
+from rom_access import map_file
 
 def savebit(input_filename, output_filename, hex_offset, hex_length):
     # Convert hex offset and length to integers
@@ -7,14 +8,9 @@ def savebit(input_filename, output_filename, hex_offset, hex_length):
     end_address = offset + length - 1
     
     try:
-        # Open the input file in binary mode and read the specified portion
-        with open(input_filename, 'rb') as infile:
-            infile.seek(offset)
-            data = infile.read(length)
-        
-        # Write the read data to the output file
-        with open(output_filename, 'wb') as outfile:
-            outfile.write(data)
+        # Map the input file and write the specified portion straight from it, nothing is copied before the write
+        with map_file(input_filename) as data, open(output_filename, 'wb') as outfile:
+            outfile.write(data[offset:offset + length])
         
         print(f"Successfully saved {length} bytes from {input_filename} (offset {hex_offset}) to {output_filename}")
         print(f"Data saved from offset {hex(offset)} to {hex(end_address)}")
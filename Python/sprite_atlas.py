@@ -1,233 +1,223 @@
 import argparse
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import sys
+import time
 import csv
+import os
+import numpy as np
+from sprite_decode import SpriteCache, render_image, sprite_digest, opaque_bounds
+from palette5bit_to_8bit import load_palette_file, read_palette
+from atlas_layout import LAYOUTS, SORT_KEYS, pack, pack_pages
+from sprite_table import load_sprite_table, load_variations, load_sprite_csv
+from rom_access import map_file, read_view
+from profiling import Profiler, add_profile_arguments
+from image_writer import ImageWriter, add_writer_arguments, page_filename
+from text_labels import LabelRenderer, load_font
 
-ENTRY_SIZE = 10
+def check_sprite_data(sprite_bin, offset, xsize, ysize):
+    sprite_size = (xsize * ysize + 1) // 2
+    if offset + sprite_size > len(sprite_bin):
+        raise ValueError(f"Sprite data too short: have {max(len(sprite_bin) - offset, 0)} bytes, need {sprite_size}")
 
-def read_long(data, offset):
-    return int.from_bytes(data[offset:offset+4], 'big')
+def paste_label(overlay, label_img, x, y):
+    # alpha_composite can't take a negative position, so trim anything hanging off the top or left
+    left, top = max(0, -x), max(0, -y)
+    if left or top:
+        label_img = label_img.crop((left, top, label_img.width, label_img.height))
+    overlay.alpha_composite(label_img, (x + left, y + top))
 
-def get_sprite_table_entry(rom, entry_offset):
-    if entry_offset + ENTRY_SIZE > len(rom):
-        raise ValueError(f"Entry offset 0x{entry_offset:06X} out of ROM bounds")
-    xsize      = rom[entry_offset+1]
-    ysize      = rom[entry_offset+3] + 1
-    bank       = rom[entry_offset+7]
-    offset     = (rom[entry_offset+8] << 8) | rom[entry_offset+9]
-    fulloffset = (bank * 0x10000 + offset) * 4
-    return xsize, ysize, fulloffset
+def draw_labels(overlay, page_sprites, padding, labels):
+    last_sprite = None
+    for entry_offset, _, _, _, palette_num, _, (_, _, xsize, ysize), sx, sy in page_sprites:
+        # The full code offset is only shown again when the sprite to the left is a different entry
+        prev_offset, prev_right, prev_top, prev_bottom = last_sprite or (None, None, 0, 0)
+        same_row = prev_right == sx and sy < prev_bottom and prev_top < sy + ysize
+        if prev_offset == entry_offset and same_row:
+            hex_code = f"{palette_num:02X}"
+        else:
+            hex_code = f"{entry_offset:X}:{palette_num:02X}"
+        label_img, text_width = labels.label(hex_code)
+        text_x = sx + (xsize - text_width) // 2
+        text_y = sy + ysize + 2
+        paste_label(overlay, label_img, text_x - 1, text_y - 1)
+        # entry offset, where the next sprite to the right would start, top and bottom
+        last_sprite = (entry_offset, sx + xsize + padding, sy, sy + ysize)
 
-def read_sprite_data(sprite_bin, offset, xsize, ysize):
-    sprite_size = (xsize * ysize + 1) // 2
-    return sprite_bin[offset:offset + sprite_size]
+def render_atlas_page(sprite_cache, page_sprites, width, height, padding, output_file, overlay_file=None, box_file=None, labels=None,
+                      profiler=None, writer=None):
+    """Paste one page of placed sprites into a new atlas (plus overlay and box images) and save it.
 
-def read_palette(palette_bin, palette_num):
-    palette_offset = palette_num * 16 * 3
-    palette_bytes = palette_bin[palette_offset:palette_offset + 16 * 3]
-    return [(palette_bytes[i*3], palette_bytes[i*3+1], palette_bytes[i*3+2]) for i in range(16)]
+    With the indexed and raw encoders the atlas is a plane of the sprites colour numbers rather than an image.
+    Only the trim box (left, top, box_width, box_height) of each sprite is pasted, the whole sprite without --trim.
+    """
+    profiler = profiler or Profiler('sprite_atlas')
+    writer = writer or ImageWriter()
+    index_plane = writer.encoder != 'png'
+    with profiler.stage('paste'):
+        if index_plane:
+            atlas = np.zeros((height, width), dtype=np.uint8)
+        else:
+            atlas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        for entry_offset, xsize, ysize, data_offset, palette_num, palette, (left, top, box_width, box_height), sx, sy in page_sprites:
+            start = time.perf_counter()
+            indices = sprite_cache.indices(data_offset, xsize, ysize)[top:top + box_height, left:left + box_width]
+            if index_plane:
+                atlas[sy:sy + box_height, sx:sx + box_width] = indices
+            else:
+                atlas.paste(render_image(indices, palette), (sx, sy))
+            profiler.sprite('paste', f"{entry_offset:X}:{palette_num:02X}", time.perf_counter() - start, box_width * box_height)
+    with profiler.stage('save'):
+        writer.add(*(writer.write_indices(atlas, output_file) if index_plane else writer.write_image(atlas, output_file)))
+    del atlas
 
-def load_sprite_csv(csv_file):
-    entries = []
-    with open(csv_file, encoding='utf-8-sig', newline='') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row or not row[0]:
-                continue
-            # Skip header row
-            if row[0].strip().lower().startswith('hex') or row[0].strip().lower().startswith('off'):
-                continue
+    if overlay_file:
+        with profiler.stage('labels'):
+            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+            draw_labels(overlay, page_sprites, padding, labels)
+        with profiler.stage('save'):
+            writer.add(*writer.write_image(overlay, overlay_file))
+        del overlay
+
+    if box_file:
+        with profiler.stage('box'):
+            box = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+            box_draw = ImageDraw.Draw(box)
+            box_color = (128, 128, 128, 255)  # mid grey
+            for _, _, _, _, _, _, (_, _, xsize, ysize), sx, sy in page_sprites:
+                box_draw.rectangle(
+                    [sx, sy, sx + xsize - 1, sy + ysize - 1],
+                    outline=box_color
+                )
+        with profiler.stage('save'):
+            writer.add(*writer.write_image(box, box_file))
+
+def create_sprite_atlas(code_bin, sprite_bin, palette_bin, output_file, sprite_entries, padding=16, overlay_file=None, box_file=None,
+                        raw_palette=False, layout='shelf', max_width=4096, max_height=None, sort='none', page_size=None, index_file=None, table_index=None,
+                        variations=False, variations_cache=None, dedupe=False, trim=False, profiler=None, writer=None):
+    profiler = profiler or Profiler('sprite_atlas')
+    writer = writer or ImageWriter()
+    writer.check_filename(output_file)
+    with profiler.stage('load'):
+        sprite_table = load_sprite_table(code_bin, table_index)
+        sprite_file = map_file(sprite_bin)
+        sprite_data = sprite_file.data
+        if variations:
+            sprite_entries = load_variations(sprite_entries, sprite_table, len(sprite_data), variations_cache)
+        palette_data = load_palette_file(palette_bin, raw=raw_palette)
+        sprite_cache = SpriteCache(sprite_data)
+
+    with profiler.stage('plan'):
+        sprites = []
+        # With dedupe, entries that make the same image as an earlier sprite are not packed again, they are kept
+        # against the (entry_offset, palette_num) of the sprite that is and share its place in the index
+        # With trim, only the box around the opaque pixels of each sprite is packed
+        digests = {}
+        aliases = {}
+        trims = {}
+        for idx, (entry_offset, palette_nums) in enumerate(sprite_entries):
             try:
-                entry_offset = int(row[0].strip(), 16)
+                xsize, ysize, data_offset = sprite_table.sprite_entry(entry_offset)
+                if xsize > 0 and ysize > 0:
+                    # Checked before the layout so a bad sprite can't leave a hole in the atlas
+                    check_sprite_data(sprite_data, data_offset, xsize, ysize)
+                    key = (data_offset, xsize, ysize)
+                    if key not in trims:
+                        trims[key] = opaque_bounds(sprite_cache.indices(*key)) if trim else (0, 0, xsize, ysize)
+                    for palette_num in palette_nums:
+                        palette = read_palette(palette_data, palette_num)
+                        if dedupe:
+                            # Just this sprites bytes, as a view so nothing is copied for the digest
+                            digest = sprite_digest(read_view(sprite_data, data_offset, (xsize * ysize + 1) // 2), xsize, ysize, palette)
+                            canonical = digests.setdefault(digest, (entry_offset, palette_num))
+                            if canonical != (entry_offset, palette_num) or canonical in aliases:
+                                aliases.setdefault(canonical, []).append((entry_offset, palette_num))
+                                continue
+                            aliases[canonical] = []
+                        sprites.append((entry_offset, xsize, ysize, data_offset, palette_num, palette, trims[key]))
             except Exception as e:
-                print(f"Skipping row {row}: {e}")
+                print(f"Skipping entry at code offset 0x{entry_offset:X}: {e}")
                 continue
-            # Flatten all palette fields (split if needed)
-            palette_fields = []
-            for p in row[1:]:
-                for sub_p in p.split(','):
-                    if sub_p.strip():
-                        palette_fields.append(sub_p.strip())
-            palettes = [int(p, 16) for p in palette_fields]
-            entries.append((entry_offset, palettes))
-    return entries
-
-def build_full_variation_entries(sprite_entries, entry_size=10):
-    """Expand entries to all offsets from min to max, using palettes as specified or inherited."""
-    if not sprite_entries:
-        return []
-    # Sort by offset
-    sprite_entries = sorted(sprite_entries, key=lambda x: x[0])
-    offset_to_palettes = {off: palettes for off, palettes in sprite_entries}
-    min_offset = sprite_entries[0][0]
-    max_offset = sprite_entries[-1][0]
+        sprite_cache.clear()
+    sprite_table.close()
 
-    result = []
-    last_palettes = None
-    for off in range(min_offset, max_offset + 1, entry_size):
-        palettes = offset_to_palettes.get(off)
-        if palettes is not None:
-            last_palettes = palettes
-        if last_palettes is not None:
-            result.append((off, last_palettes))
-    return result
-
-def create_sprite_image(sprite_bytes, palette, xsize, ysize):
-    img = Image.new('RGBA', (xsize, ysize))
-    pixels = []
-    for i in range(xsize * ysize):
-        byte_pos = i // 2
-        if i % 2 == 0:
-            color_index = (sprite_bytes[byte_pos] >> 4) & 0x0F
-        else:
-            color_index = sprite_bytes[byte_pos] & 0x0F
-        if color_index in (0, 15):
-            pixels.append((0, 0, 0, 0))
+    # Atlas layout calculation, each sprite takes its size plus the label below it and padding right and below,
+    # the gap on the top and left of the atlas is added after packing
+    label_height = 14 if overlay_file else 0
+    sizes = [(box_width + padding, box_height + label_height + padding) for _, _, _, _, _, _, (_, _, box_width, box_height) in sprites]
+    paged = page_size is not None
+    with profiler.stage('layout'):
+        if paged:
+            placements = pack_pages(sizes, layout=layout, page_width=page_size[0] - padding, page_height=page_size[1] - padding, sort=sort)
         else:
-            r, g, b = palette[color_index]
-            pixels.append((r, g, b, 255))
-    img.putdata(pixels)
-    return img
-
-def create_sprite_atlas(code_bin, sprite_bin, palette_bin, output_file, sprite_entries, padding=16, overlay_file=None, box_file=None):
-    with open(code_bin, 'rb') as f:
-        code_data = f.read()
-    with open(sprite_bin, 'rb') as f:
-        sprite_data = f.read()
-    with open(palette_bin, 'rb') as f:
-        palette_data = f.read()
+            positions, used_width, used_height = pack(sizes, layout=layout, max_width=max_width, max_height=max_height, sort=sort)
+            placements = [None if pos is None else (0, pos[0], pos[1]) for pos in positions]
+            page_size = (used_width + padding, used_height + padding)
 
-    sprites = []
-    for idx, (entry_offset, palette_nums) in enumerate(sprite_entries):
-        try:
-            xsize, ysize, data_offset = get_sprite_table_entry(code_data, entry_offset)
-            if xsize > 0 and ysize > 0:
-                for palette_num in palette_nums:
-                    sprites.append((entry_offset, xsize, ysize, data_offset, palette_num))
-        except Exception as e:
-            print(f"Skipping entry at code offset 0x{entry_offset:X}: {e}")
+    pages = {} if paged else {0: []}
+    for sprite, placement in zip(sprites, placements):
+        if placement is None:
+            entry_offset, _, _, _, palette_num, _, (_, _, box_width, box_height) = sprite
+            print(f"Skipping code offset {entry_offset:X} palette {palette_num:02X}: {box_width}x{box_height} does not fit in the atlas")
             continue
+        page, x, y = placement
+        pages.setdefault(page, []).append(sprite + (x + padding, y + padding))
+    if not any(pages.values()):
+        sprite_file.close()
+        print("No sprites to put in the atlas")
+        return
 
-    # Atlas layout calculation
-    label_height = 14 if overlay_file else 0
-    row_width = 0
-    max_row_width = 0
-    current_row_height = 0
-    total_height = 0
-
-    # Calculate dimensions, add padding on both sides (left+right, top+bottom)
-    for _, xsize, ysize, _, _ in sprites:
-        if row_width + xsize + padding > 4096:
-            max_row_width = max(max_row_width, row_width)
-            total_height += current_row_height + padding + label_height
-            row_width = 0
-            current_row_height = 0
-        row_width += xsize + padding
-        current_row_height = max(current_row_height, ysize)
-
-    max_row_width = max(max_row_width, row_width)
-    total_height += current_row_height + label_height
+    labels = LabelRenderer(load_font(12)) if overlay_file else None
 
-    # Add padding to right and bottom for clean border
-    atlas_width = max_row_width + padding
-    atlas_height = total_height + padding
-
-    atlas = Image.new('RGBA', (atlas_width, atlas_height), (0, 0, 0, 0))
-    overlay = None
-    box = None
+    # Pages are built and saved one at a time, so only one page of images is held in memory
+    index_rows = []
+    sprite_area = 0
+    for page in sorted(pages):
+        files = [output_file, overlay_file, box_file]
+        if paged:
+            files = [page_filename(f, page) if f else None for f in files]
+        render_atlas_page(sprite_cache, pages[page], page_size[0], page_size[1], padding, *files, labels=labels, profiler=profiler, writer=writer)
+        sprite_cache.clear()
+        for entry_offset, xsize, ysize, _, palette_num, _, (left, top, box_width, box_height), sx, sy in pages[page]:
+            # x, y, xsize, ysize are the rectangle in the atlas, trim_x/y where it sits in the sprite_xsize x sprite_ysize sprite
+            place = (sx, sy, box_width, box_height, left, top, xsize, ysize) + page_size
+            index_rows.append((os.path.basename(files[0]), page, f"{entry_offset:X}", f"{palette_num:02X}") + place)
+            for alias_offset, alias_palette in aliases.get((entry_offset, palette_num), []):
+                index_rows.append((os.path.basename(files[0]), page, f"{alias_offset:X}", f"{alias_palette:02X}") + place)
+            sprite_area += box_width * box_height
+        if paged:
+            print(f"Saved page {page}: {files[0]} ({len(pages[page])} sprites)")
+    sprite_file.close()
 
+    print(f"Created atlas with {len(index_rows)} sprite variations")
+    if dedupe:
+        print(f"Deduplicated to {sum(len(p) for p in pages.values())} unique images")
+    if paged:
+        print(f"Pages: {len(pages)} of {page_size[0]}x{page_size[1]}")
+    else:
+        print(f"Dimensions: {page_size[0]}x{page_size[1]}")
+    total_area = page_size[0] * page_size[1] * max(len(pages), 1)
+    if total_area:
+        print(f"Packing efficiency ({layout}): {sprite_area / total_area:.1%} of the atlas is sprite pixels")
     if overlay_file:
-        overlay = Image.new('RGBA', (atlas_width, atlas_height), (0, 0, 0, 0))
-        try:
-            font = ImageFont.truetype("arial.ttf", 12)
-        except:
-            font = ImageFont.load_default()
-        draw = ImageDraw.Draw(overlay)
+        print(f"Code overlay saved to: {page_filename(overlay_file, 0) if paged else overlay_file}")
     if box_file:
-        box = Image.new('RGBA', (atlas_width, atlas_height), (0, 0, 0, 0))
-        box_draw = ImageDraw.Draw(box)
-        box_color = (128, 128, 128, 255)  # mid grey
-
-    # Start positions (gap on top/left)
-    x_pos, y_pos = padding, padding
-    current_row_height = 0
-    row_start_y = padding
-    row_sprites = []
-
-    for entry_offset, xsize, ysize, data_offset, palette_num in sprites:
-        if x_pos + xsize > atlas_width - padding:
-            # FLUSH the row
-            last_overlay_offset = None  # <-- RESET for each row!
-            for sx, sy, soff, ssprite_img, spalette_num in row_sprites:
-                sprite_y = row_start_y + (current_row_height - ssprite_img.height)
-                atlas.paste(ssprite_img, (sx, sprite_y))
-                if overlay:
-                    if soff != last_overlay_offset:
-                        hex_code = f"{soff:X}:{spalette_num:02X}"
-                        last_overlay_offset = soff
-                    else:
-                        hex_code = f"{spalette_num:02X}"
-                    bbox = draw.textbbox((0, 0), hex_code, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    text_x = sx + (ssprite_img.width - text_width) // 2
-                    text_y = row_start_y + current_row_height + 2
-                    for ox, oy in [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]:
-                        draw.text((text_x+ox, text_y+oy), hex_code, font=font, fill=(0,0,0,255))
-                    draw.text((text_x, text_y), hex_code, font=font, fill=(255,255,255,255))
-                if box:
-                    box_draw.rectangle(
-                        [sx, sprite_y, sx + ssprite_img.width - 1, sprite_y + ssprite_img.height - 1],
-                        outline=box_color
-                    )
-            x_pos = padding
-            y_pos += current_row_height + padding + label_height
-            row_start_y = y_pos
-            current_row_height = 0
-            row_sprites = []
+        print(f"Box overlay saved to: {page_filename(box_file, 0) if paged else box_file}")
+    print(writer.summary())
 
-        try:
-            palette = read_palette(palette_data, palette_num)
-            sprite_bytes = read_sprite_data(sprite_data, data_offset, xsize, ysize)
-            sprite_img = create_sprite_image(sprite_bytes, palette, xsize, ysize)
-            row_sprites.append((x_pos, y_pos, entry_offset, sprite_img, palette_num))
-            current_row_height = max(current_row_height, ysize)
-            x_pos += xsize + padding
-        except Exception as e:
-            print(f"Skipping code offset {entry_offset:X}: {str(e)}")
+    # A raw page has no header, the index is where its size is kept
+    if (paged or writer.encoder == 'raw') and index_file is None:
+        index_file = os.path.splitext(output_file)[0] + "_index.csv"
+    if index_file:
+        with profiler.stage('index'), open(index_file, "w", newline="") as csvfile:
+            index_writer = csv.writer(csvfile)
+            index_writer.writerow(["file", "page", "entry_offset", "palette", "x", "y", "xsize", "ysize", "trim_x", "trim_y", "sprite_xsize", "sprite_ysize",
+                                   "page_xsize", "page_ysize"])
+            index_writer.writerows(index_rows)
+        print(f"Sprite index written to {index_file}")
 
-    # FLUSH final row
-    last_overlay_offset = None  # <-- RESET for the last row!
-    for sx, sy, soff, ssprite_img, spalette_num in row_sprites:
-        sprite_y = row_start_y + (current_row_height - ssprite_img.height)
-        atlas.paste(ssprite_img, (sx, sprite_y))
-        if overlay:
-            if soff != last_overlay_offset:
-                hex_code = f"{soff:X}:{spalette_num:02X}"
-                last_overlay_offset = soff
-            else:
-                hex_code = f"{spalette_num:02X}"
-            bbox = draw.textbbox((0, 0), hex_code, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_x = sx + (ssprite_img.width - text_width) // 2
-            text_y = row_start_y + current_row_height + 2
-            for ox, oy in [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]:
-                draw.text((text_x+ox, text_y+oy), hex_code, font=font, fill=(0,0,0,255))
-            draw.text((text_x, text_y), hex_code, font=font, fill=(255,255,255,255))
-        if box:
-            box_draw.rectangle(
-                [sx, sprite_y, sx + ssprite_img.width - 1, sprite_y + ssprite_img.height - 1],
-                outline=box_color
-            )
-
-    atlas.save(output_file)
-    print(f"Created atlas with {len(sprites)} sprite variations")
-    print(f"Dimensions: {atlas_width}x{atlas_height}")
-    if overlay:
-        overlay.save(overlay_file)
-        print(f"Code overlay saved to: {overlay_file}")
-    if box:
-        box.save(box_file)
-        print(f"Box overlay saved to: {box_file}")
+def parse_page_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height or width)
 
 def main():
     parser = argparse.ArgumentParser(description='Create sprite atlas from sprite entry offsets/palette CSV, with --variations for full range expansion')
@@ -239,12 +229,24 @@ def main():
     parser.add_argument('--padding', type=int, default=16, help='Padding between sprites (default: 16)')
     parser.add_argument('--overlay', help='Generate code overlay PNG')
     parser.add_argument('--box', help='Generate box overlay PNG')
-    parser.add_argument('--variations', action='store_true', help='If set, process every entry from min to max offset, using most recent palette')
+    parser.add_argument('--table-index', help='Saved sprite table index (.npy) to use instead of parsing code.bin, made from code.bin if it does not exist yet')
+    parser.add_argument('--raw-palette', action='store_true', help='palette_bin is raw 5-5-5 palette RAM (e.g. outrun_palettes.bin) rather than 8-bit RGB')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='shelf', help='Packing method (default: shelf)')
+    parser.add_argument('--max-width', type=int, default=4096, help='Maximum atlas width, before the border padding, when not using pages (default: 4096)')
+    parser.add_argument('--max-height', type=int, help='Maximum atlas height, sprites that do not fit are skipped (default: no limit)')
+    parser.add_argument('--sort', choices=list(SORT_KEYS), default='none', help='Pack the largest sprites first by this size (default: none, CSV order)')
+    parser.add_argument('--page-size', type=parse_page_size, help='Split the atlas over pages of this size, e.g. 4096 or 4096x2048, saved as <name>_000.png, <name>_001.png ...')
+    parser.add_argument('--index', help='Write a CSV of each sprites page and position (always written with --page-size or --encoder raw, default <name>_index.csv)')
+    parser.add_argument('--variations', action='store_true', help='Also process the scale variations found after each CSV entry, using its palettes')
+    parser.add_argument('--dedupe', action='store_true', help='Pack each unique image once, duplicates share its place in the index')
+    parser.add_argument('--variations-cache', help='CSV to keep the found variations in, reused while code.bin, the sprite binary and the CSV are unchanged')
+    parser.add_argument('--trim', action='store_true', help='Pack only the box around the opaque pixels of each sprite, the index gives where the box sits in the sprite')
+    add_writer_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    sprite_entries = load_sprite_csv(args.offset_palette_csv)
-
-    if args.variations:
-        sprite_entries = build_full_variation_entries(sprite_entries)
+    profiler = Profiler.from_args('sprite_atlas', args)
+    with profiler.stage('load'):
+        sprite_entries = load_sprite_csv(args.offset_palette_csv)
 
     create_sprite_atlas(
         args.code_bin,
@@ -254,8 +256,23 @@ def main():
         sprite_entries,
         padding=args.padding,
         overlay_file=args.overlay,
-        box_file=args.box
+        box_file=args.box,
+        raw_palette=args.raw_palette,
+        layout=args.layout,
+        max_width=args.max_width,
+        max_height=args.max_height,
+        sort=args.sort,
+        page_size=args.page_size,
+        index_file=args.index,
+        table_index=args.table_index,
+        variations=args.variations,
+        variations_cache=args.variations_cache,
+        dedupe=args.dedupe,
+        trim=args.trim,
+        profiler=profiler,
+        writer=ImageWriter.from_args(args)
     )
+    profiler.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,102 @@
+import hashlib
+import struct
+import numpy as np
+from PIL import Image
+
+# Colour 0 is transparent and colour 15 is the hardware end-of-sprite marker
+TRANSPARENT_INDICES = (0, 15)
+
+def unpack_4bpp(sprite_bytes, xsize, ysize):
+    """Unpack packed 4bpp sprite data (high nibble first) into a (ysize, xsize) index plane."""
+    pixel_count = xsize * ysize
+    expected_bytes = (pixel_count + 1) // 2
+    if len(sprite_bytes) < expected_bytes:
+        raise ValueError(f"Sprite data too short: have {len(sprite_bytes)} bytes, need {expected_bytes}")
+    packed = np.frombuffer(sprite_bytes, dtype=np.uint8, count=expected_bytes)
+    nibbles = np.empty(expected_bytes * 2, dtype=np.uint8)
+    nibbles[0::2] = packed >> 4
+    nibbles[1::2] = packed & 0x0F
+    return nibbles[:pixel_count].reshape(ysize, xsize)
+
+def opaque_bounds(indices):
+    """(left, top, width, height) of the pixels that aren't colour 0 or 15, a 1x1 box in the corner if there are none."""
+    opaque = ~np.isin(indices, TRANSPARENT_INDICES)
+    rows = np.flatnonzero(opaque.any(axis=1))
+    if len(rows) == 0:
+        return 0, 0, 1, 1
+    cols = np.flatnonzero(opaque.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+def sprite_digest(sprite_bytes, xsize, ysize, palette):
+    """blake2b of a sprites index plane, size and palette colours, sprites with the same digest make the same image.
+
+    The packed bytes are the index plane as is, only the spare low nibble of an odd sized sprite is cleared first.
+    """
+    plane = bytearray(sprite_bytes[:(xsize * ysize + 1) // 2])
+    if (xsize * ysize) & 1:
+        plane[-1] &= 0xF0
+    digest = hashlib.blake2b(struct.pack('>HH', xsize, ysize), digest_size=16)
+    digest.update(plane)
+    digest.update(bytes(c for colour in palette for c in colour))
+    return digest.hexdigest()
+
+def palette_lut(palette):
+    """Build a 16x4 RGBA lookup table from 16 (r, g, b) colours, colours 0/15 fully transparent."""
+    lut = np.zeros((16, 4), dtype=np.uint8)
+    lut[:, :3] = np.asarray(palette, dtype=np.uint8).reshape(16, 3)
+    lut[:, 3] = 255
+    lut[list(TRANSPARENT_INDICES)] = 0
+    return lut
+
+def flat_palette_256(palette):
+    """Flatten 16 (r, g, b) colours into a 768 byte 'P' mode palette, padded with black."""
+    flat = np.zeros(256 * 3, dtype=np.uint8)
+    flat[:16 * 3] = np.asarray(palette, dtype=np.uint8).reshape(-1)
+    return flat.tobytes()
+
+def render_rgba(indices, palette):
+    """Apply a palette to a decoded index plane, giving a (ysize, xsize, 4) RGBA array."""
+    return palette_lut(palette)[indices]
+
+def render_image(indices, palette):
+    return Image.fromarray(render_rgba(indices, palette))
+
+def render_indexed_image(indices, palette):
+    """4bpp indexed PNG image (palette mode 'P'), with color 15 remapped to 0 for transparency."""
+    img = Image.fromarray(np.where(indices == 15, 0, indices).astype(np.uint8))
+    img.putpalette(flat_palette_256(palette))
+    img.info['transparency'] = 0  # only palette index 0 transparent
+    return img
+
+def decode_rgba(sprite_bytes, palette, xsize, ysize):
+    """Decode packed 4bpp sprite data straight to a (ysize, xsize, 4) RGBA array."""
+    return render_rgba(unpack_4bpp(sprite_bytes, xsize, ysize), palette)
+
+def create_sprite_image(sprite_bytes, palette, xsize, ysize):
+    return render_image(unpack_4bpp(sprite_bytes, xsize, ysize), palette)
+
+def create_indexed_image(sprite_bytes, palette, xsize, ysize):
+    return render_indexed_image(unpack_4bpp(sprite_bytes, xsize, ysize), palette)
+
+class SpriteCache:
+    """Decoded index planes keyed by (data_offset, xsize, ysize).
+
+    Each sprite is unpacked once; every palette variant of it is then only a
+    palette lookup over the cached plane.
+    """
+
+    def __init__(self, sprite_data):
+        self.sprite_data = sprite_data
+        self.planes = {}
+
+    def indices(self, data_offset, xsize, ysize):
+        key = (data_offset, xsize, ysize)
+        plane = self.planes.get(key)
+        if plane is None:
+            sprite_size = (xsize * ysize + 1) // 2
+            plane = unpack_4bpp(self.sprite_data[data_offset:data_offset + sprite_size], xsize, ysize)
+            self.planes[key] = plane
+        return plane
+
+    def clear(self):
+        self.planes.clear()
@@ -0,0 +1,162 @@
+import argparse
+import mmap
+import numpy as np
+from sprite_decode import unpack_4bpp, render_rgba, render_image
+
+# Pack layout, all little endian:
+#   header      HEADER_DTYPE, padded to HEADER_SIZE
+#   index       one INDEX_DTYPE row per sprite
+#   palettes    (palette_count, 16, 3) 8-bit RGB, the whole palette file so palette numbers index it directly
+#   planes      each distinct (data, size) once, raw 8bpp (one byte per pixel) or 4bpp packed high nibble first
+# Every block starts on an ALIGN boundary so numpy can view it straight out of a memory map.
+MAGIC = b'ORSP'
+VERSION = 1
+HEADER_SIZE = 64
+ALIGN = 16
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u2'),
+    ('bits', '<u2'),
+    ('count', '<u4'),
+    ('palette_count', '<u4'),
+    ('index_offset', '<u8'),
+    ('palette_offset', '<u8'),
+    ('plane_offset', '<u8'),
+])
+
+INDEX_DTYPE = np.dtype([
+    ('entry_offset', '<u4'),
+    ('xsize', '<u2'),
+    ('ysize', '<u2'),
+    ('palette', '<u2'),
+    ('bits', '<u2'),
+    ('length', '<u4'),
+    ('data_offset', '<u8'),  # from the start of the file
+])
+
+def align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+def write_pack(path, sprites, sprite_data, palette_data, bits=8):
+    """Write (entry_offset, xsize, ysize, palette_num, data_offset) sprites from all_sprites.bin into one pack file.
+
+    Sprites that share their data and size share one plane, only their index rows are repeated.
+    """
+    if bits not in (4, 8):
+        raise ValueError(f"Pack planes are 4 or 8 bits per pixel, not {bits}")
+    palette_count = len(palette_data) // (16 * 3)
+    index = np.zeros(len(sprites), dtype=INDEX_DTYPE)
+    index_offset = HEADER_SIZE
+    palette_offset = align(index_offset + index.nbytes)
+    plane_offset = align(palette_offset + palette_count * 16 * 3)
+
+    planes = []
+    plane_at = {}
+    offset = plane_offset
+    for i, (entry_offset, xsize, ysize, palette_num, data_offset) in enumerate(sprites):
+        key = (data_offset, xsize, ysize)
+        if key not in plane_at:
+            sprite_bytes = sprite_data[data_offset:data_offset + (xsize * ysize + 1) // 2]
+            plane = unpack_4bpp(sprite_bytes, xsize, ysize).tobytes() if bits == 8 else bytes(sprite_bytes)
+            plane_at[key] = (offset, len(plane))
+            planes.append(plane)
+            offset = align(offset + len(plane))
+        index[i] = (entry_offset, xsize, ysize, palette_num, bits, plane_at[key][1], plane_at[key][0])
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, VERSION, bits, len(sprites), palette_count, index_offset, palette_offset, plane_offset)
+    with open(path, 'wb') as f:
+        f.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        f.write(index.tobytes())
+        f.write(b'\0' * (palette_offset - f.tell()))
+        f.write(bytes(palette_data[:palette_count * 16 * 3]))
+        for plane in planes:
+            f.write(b'\0' * (align(f.tell()) - f.tell()))
+            f.write(plane)
+    return len(planes)
+
+class SpritePack:
+    """A pack file opened through a read only memory map.
+
+    The index and palettes are numpy views of the map, and with 8bpp planes indices() is a view too,
+    so reading a sprite is a slice rather than a file open and a PNG decode.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = np.frombuffer(self.mm, dtype=HEADER_DTYPE, count=1)[0].copy()
+        if self.header['magic'] != MAGIC or self.header['version'] != VERSION:
+            self.mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} sprite pack")
+        self.index = np.frombuffer(self.mm, dtype=INDEX_DTYPE, count=int(self.header['count']),
+                                   offset=int(self.header['index_offset']))
+        self.palettes = np.frombuffer(self.mm, dtype=np.uint8, count=int(self.header['palette_count']) * 16 * 3,
+                                      offset=int(self.header['palette_offset'])).reshape(-1, 16, 3)
+        self._by_entry = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The numpy views hold the map open, so they go first. Arrays handed out by indices() can still
+        # be alive, then the map is left for the garbage collector
+        self.index = self.palettes = self.header = None
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+
+    def find(self, entry_offset, palette_num=None):
+        """Pack position of the first sprite for a code.bin entry offset (and palette), or None."""
+        if self._by_entry is None:
+            self._by_entry = {}
+            for i, (off, pal) in enumerate(zip(self.index['entry_offset'].tolist(), self.index['palette'].tolist())):
+                self._by_entry.setdefault((off, pal), i)
+                self._by_entry.setdefault((off, None), i)
+        return self._by_entry.get((entry_offset, palette_num))
+
+    def indices(self, i):
+        """(ysize, xsize) index plane of sprite i, a view of the file for 8bpp packs."""
+        row = self.index[i]
+        xsize, ysize = int(row['xsize']), int(row['ysize'])
+        data = np.frombuffer(self.mm, dtype=np.uint8, count=int(row['length']), offset=int(row['data_offset']))
+        if row['bits'] == 8:
+            return data.reshape(ysize, xsize)
+        return unpack_4bpp(data, xsize, ysize)
+
+    def palette(self, i):
+        return self.palettes[self.index[i]['palette']]
+
+    def rgba(self, i):
+        return render_rgba(self.indices(i), self.palette(i))
+
+    def image(self, i):
+        return render_image(self.indices(i), self.palette(i))
+
+def main():
+    parser = argparse.ArgumentParser(description='List the sprites in a pack file, or save one of them as a PNG')
+    parser.add_argument('pack_file', help='Pack written by sprites_extract.py --format pack')
+    parser.add_argument('--sprite', type=int, help='Save this sprite number from the pack')
+    parser.add_argument('--output', default='sprite.png', help='PNG for --sprite (default: sprite.png)')
+    args = parser.parse_args()
+
+    with SpritePack(args.pack_file) as pack:
+        if args.sprite is not None:
+            pack.image(args.sprite).save(args.output)
+            print(f"Saved sprite {args.sprite} to {args.output}")
+            return
+        print(f"{len(pack)} sprites, {pack.header['bits']}bpp planes, {pack.header['palette_count']} palettes")
+        print("sprite,entry_offset,xsize,ysize,palette")
+        for i, row in enumerate(pack.index):
+            print(f"{i},{row['entry_offset']:X},{row['xsize']},{row['ysize']},{row['palette']:02X}")
+
+if __name__ == '__main__':
+    main()
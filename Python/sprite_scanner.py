@@ -0,0 +1,210 @@
+import argparse
+import csv
+import numpy as np
+from PIL import Image
+from rom_access import map_file
+from sprite_table import load_sprite_table
+from profiling import Profiler, add_profile_arguments
+
+# Every line of a sprite ends in colour 15, so in a sprite of width w the 15s sit exactly w pixels apart.
+# The scan unpacks all of all_sprites.bin to nibbles, takes the gaps between consecutive 15s, and every run
+# of at least min_lines equal gaps is a region of that line width. Regions are then checked against the data
+# the 10 byte entries in code.bin point at.
+MIN_WIDTH = 2     # runs of 15s one pixel apart are 0xFF filler, not sprites
+MAX_WIDTH = 255   # xsize is one byte in an entry
+MAX_LINES = 256   # so is ysize - 1
+WORD_NIBBLES = 8  # entries point at 4 byte words
+
+# Coverage map classes, a block of the map shows the highest class of the bytes in it
+EMPTY, DATA, REFERENCED, MATCHED, UNREFERENCED = range(5)
+MAP_COLOURS = np.array([
+    (0, 0, 0),        # all zero bytes
+    (70, 70, 70),     # data that is in no region and no entry points at
+    (40, 90, 220),    # pointed at by an entry, but no region was found there
+    (0, 170, 0),      # a region an entry points at
+    (255, 140, 0),    # a region no entry points at
+], dtype=np.uint8)
+
+def scan_regions(sprite_data, min_lines=3, min_width=MIN_WIDTH, max_width=MAX_WIDTH):
+    """Regions of lines ending in colour 15 as a structured array of nibble start, end, width and lines."""
+    packed = np.frombuffer(sprite_data, dtype=np.uint8)
+    nibbles = np.empty(len(packed) * 2, dtype=np.uint8)
+    nibbles[0::2] = packed >> 4
+    nibbles[1::2] = packed & 0x0F
+    markers = np.flatnonzero(nibbles == 15)
+    regions = np.zeros(0, dtype=[('start', '<i8'), ('end', '<i8'), ('width', '<i4'), ('lines', '<i4')])
+    if len(markers) < 2:
+        return regions
+    gaps = np.diff(markers)
+    # Runs of equal gaps, run i covers gaps[starts[i]:ends[i]] and so markers starts[i]..ends[i]
+    edges = np.flatnonzero(np.diff(gaps)) + 1
+    starts = np.concatenate(([0], edges))
+    ends = np.concatenate((edges, [len(gaps)]))
+    width = gaps[starts]
+    lines = ends - starts + 1
+    keep = (lines >= min_lines) & (width >= min_width) & (width <= max_width)
+    starts, ends, width, lines = starts[keep], ends[keep], width[keep], lines[keep]
+    regions = np.zeros(len(starts), dtype=regions.dtype)
+    regions['start'] = markers[starts] - width + 1
+    regions['end'] = markers[ends] + 1
+    regions['width'] = width
+    regions['lines'] = lines
+    # When the sprite before ends with a 15 right where this one starts, that 15 is also one width before this
+    # ones first line end, and the run picks it up as an extra line. A region that isn't word aligned but
+    # is from its second line has the extra line dropped
+    extra = (regions['start'] % WORD_NIBBLES != 0) & ((regions['start'] + regions['width']) % WORD_NIBBLES == 0) & (regions['lines'] > min_lines)
+    regions['start'][extra] += regions['width'][extra]
+    regions['lines'][extra] -= 1
+    # The first line can't start before the data does
+    return regions[regions['start'] >= 0]
+
+def referenced_entries(table, sprite_size):
+    """Entries (every slot of the entry region and the pointer table) with a width and their pixels in all_sprites.bin."""
+    entries = np.concatenate((np.asarray(table.entries), np.asarray(table.pointers)))
+    entries = entries[entries['xsize'] > 0]
+    entries = entries[entries['data_offset'].astype(np.int64) + entries['length'] <= sprite_size]
+    return np.unique(entries)
+
+def coverage_map(sprite_data, regions, entries):
+    """Class of every byte of all_sprites.bin, and for each region its status and the entries that start on it."""
+    size = len(sprite_data)
+    classes = np.where(np.frombuffer(sprite_data, dtype=np.uint8) != 0, DATA, EMPTY).astype(np.uint8)
+
+    # Bytes any entry points at, counted with a difference array so there's no loop over entries
+    starts = entries['data_offset'].astype(np.int64)
+    delta = np.zeros(size + 1, dtype=np.int32)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, starts + entries['length'], -1)
+    referenced = np.cumsum(delta[:-1]) > 0
+    classes[referenced] = REFERENCED
+    referenced_before = np.concatenate(([0], np.cumsum(referenced)))
+
+    by_start = {}
+    for entry in entries:
+        by_start.setdefault((int(entry['data_offset']), int(entry['xsize'])), []).append(int(entry['entry_offset']))
+
+    statuses = []
+    matches = []
+    for region in regions:
+        first, last = int(region['start']) // 2, (int(region['end']) + 1) // 2
+        match = by_start.get((first, int(region['width']))) if region['start'] % 2 == 0 else None
+        if match:
+            status = 'matched'
+        elif referenced_before[last] - referenced_before[first]:
+            status = 'overlap'
+        else:
+            status = 'unreferenced'
+        classes[first:last] = np.maximum(classes[first:last], UNREFERENCED if status == 'unreferenced' else MATCHED)
+        statuses.append(status)
+        matches.append(match or [])
+    return classes, statuses, matches
+
+def save_coverage_image(classes, path, map_width=1024, bytes_per_pixel=16):
+    """One pixel per bytes_per_pixel bytes, map_width pixels a row, coloured with MAP_COLOURS."""
+    blocks = -(-len(classes) // bytes_per_pixel)
+    padded = np.zeros(blocks * bytes_per_pixel, dtype=np.uint8)
+    padded[:len(classes)] = classes
+    block_classes = padded.reshape(blocks, bytes_per_pixel).max(axis=1)
+    rows = -(-blocks // map_width)
+    grid = np.zeros(rows * map_width, dtype=np.uint8)
+    grid[:blocks] = block_classes
+    Image.fromarray(MAP_COLOURS[grid.reshape(rows, map_width)]).save(path)
+
+def candidate_entries(region):
+    """(data_offset, lines, 10 byte entry) for an unreferenced region, in the layout the tools parse.
+
+    A region taller than one entry can describe is split into parts of up to MAX_LINES lines, each a word
+    aligned MAX_LINES * width pixels on from the last. Empty if the region isn't word aligned.
+    """
+    if region['start'] % WORD_NIBBLES:
+        return []
+    width = int(region['width'])
+    parts = []
+    for first_line in range(0, int(region['lines']), MAX_LINES):
+        lines = min(int(region['lines']) - first_line, MAX_LINES)
+        data_offset = (int(region['start']) + first_line * width) // 2
+        bank, offset = divmod(data_offset // 4, 0x10000)
+        if bank > 0xFF:
+            break
+        parts.append((data_offset, lines, bytes([0, width, 0, lines - 1, 0, 0, 0, bank, offset >> 8, offset & 0xFF])))
+    return parts
+
+def scan_sprite_rom(code_bin, sprite_bin, regions_file, candidates_file=None, map_file_name=None, table_index=None,
+                    min_lines=3, map_width=1024, bytes_per_pixel=16, profiler=None):
+    profiler = profiler or Profiler('sprite_scanner')
+    with profiler.stage('load'):
+        sprite_file = map_file(sprite_bin)
+        sprite_data = sprite_file.data
+        table = load_sprite_table(code_bin, table_index)
+    with profiler.stage('scan'):
+        regions = scan_regions(sprite_data, min_lines)
+    profiler.count('scan', len(regions), len(sprite_data) * 2)
+    with profiler.stage('crossref'):
+        entries = referenced_entries(table, len(sprite_data))
+        classes, statuses, matches = coverage_map(sprite_data, regions, entries)
+    table.close()
+    sprite_file.close()
+
+    with profiler.stage('save'):
+        with open(regions_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['data_offset', 'end', 'nibble', 'width', 'lines', 'status', 'entry_offsets'])
+            for region, status, match in zip(regions, statuses, matches):
+                writer.writerow([f"{int(region['start']) // 2:X}", f"{(int(region['end']) + 1) // 2:X}", int(region['start']) % 2,
+                                 int(region['width']), int(region['lines']), status, ' '.join(f"{m:X}" for m in match)])
+        print(f"Region table written to {regions_file}")
+
+        candidates = [(region, candidate_entries(region)) for region, status in zip(regions, statuses) if status == 'unreferenced']
+        candidates = [(region, parts) for region, parts in candidates if parts]
+        entry_count = sum(len(parts) for _, parts in candidates)
+        split = sum(len(parts) > 1 for _, parts in candidates)
+        if candidates_file:
+            with open(candidates_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                # part is blank for a region one entry covers, "2/3" for the second of three entries a taller one was split into
+                writer.writerow(['data_offset', 'xsize', 'ysize', 'bank', 'offset', 'entry_bytes', 'part'])
+                for region, parts in candidates:
+                    for i, (data_offset, lines, entry) in enumerate(parts):
+                        writer.writerow([f"{data_offset:X}", int(region['width']), lines, f"{entry[7]:02X}", f"{entry[8] << 8 | entry[9]:04X}",
+                                         entry.hex(' ').upper(), f"{i + 1}/{len(parts)}" if len(parts) > 1 else ''])
+            print(f"{entry_count} candidate entries written to {candidates_file}")
+        if map_file_name:
+            save_coverage_image(classes, map_file_name, map_width, bytes_per_pixel)
+            print(f"Coverage map saved to {map_file_name}")
+
+    counts = np.bincount(classes, minlength=len(MAP_COLOURS))
+    total = max(len(classes), 1)
+    statuses = np.array(statuses)
+    print(f"{len(regions)} regions: {int((statuses == 'matched').sum())} matched, {int((statuses == 'overlap').sum())} overlapping entries, "
+          f"{int((statuses == 'unreferenced').sum())} unreferenced ({len(candidates)} word aligned)")
+    if split:
+        print(f"{split} word aligned regions were over {MAX_LINES} lines and were split into entries of up to {MAX_LINES} lines")
+    print(f"Coverage: {100 * (counts[MATCHED] + counts[REFERENCED]) / total:.1f}% referenced, {100 * counts[UNREFERENCED] / total:.1f}% unreferenced regions, "
+          f"{100 * counts[DATA] / total:.1f}% other data, {100 * counts[EMPTY] / total:.1f}% empty")
+    if len(regions):
+        widths, width_counts = np.unique(regions['width'], return_counts=True)
+        top = np.argsort(width_counts, kind='stable')[::-1][:10]
+        print("Most common line widths: " + ", ".join(f"{widths[i]} ({width_counts[i]})" for i in top))
+    return regions, statuses
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan all_sprites.bin for sprites by their colour 15 line end markers and check them against the entries in code.bin')
+    parser.add_argument('code_bin', help='Game code binary (with pointer and dimension tables)')
+    parser.add_argument('sprite_bin', help='Sprite data binary')
+    parser.add_argument('--regions', default='sprite_regions.csv', help='CSV of every region found (default: sprite_regions.csv)')
+    parser.add_argument('--candidates', default='sprite_candidates.csv', help='CSV of entries for the word aligned regions nothing points at (default: sprite_candidates.csv)')
+    parser.add_argument('--map', default='sprite_coverage.png', help='Coverage map PNG (default: sprite_coverage.png)')
+    parser.add_argument('--map-width', type=int, default=1024, help='Coverage map width in pixels (default: 1024)')
+    parser.add_argument('--bytes-per-pixel', type=int, default=16, help='Bytes of all_sprites.bin per coverage map pixel (default: 16)')
+    parser.add_argument('--min-lines', type=int, default=3, help='Fewest lines for a region (default: 3)')
+    parser.add_argument('--table-index', help='Saved sprite table index (.npy) to use instead of parsing the ROM, made from the ROM if it does not exist yet')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    profiler = Profiler.from_args('sprite_scanner', args)
+    scan_sprite_rom(args.code_bin, args.sprite_bin, args.regions, args.candidates, args.map, args.table_index,
+                    args.min_lines, args.map_width, args.bytes_per_pixel, profiler)
+    profiler.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from image_writer import DEFAULT_PNG_LEVEL
+from palette5bit_to_8bit import load_palette_file
+from sprite_decode import unpack_4bpp, render_image
+from sprite_table import load_sprite_table
+from rom_access import map_file, read_view
+
+# GET /sprite?index=N&palette=HH[&format=png|raw]     sprite number in the pointer table
+# GET /sprite?entry=HHHHH&palette=HH[&format=png|raw] code.bin entry offset, as in setup_table.csv
+# GET /metrics                                          cache and request counts as JSON
+# raw is the (ysize, xsize) index plane, one byte per pixel, with the size in X-Sprite-Width/Height headers.
+FORMATS = ('png', 'raw')
+
+class LRUCache:
+    """Rendered responses by key, the least recently used ones dropped once they add up to more than max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = len(value[0])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self.items[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, dropped = self.items.popitem(last=False)
+                self.bytes -= len(dropped[0])
+                self.evictions += 1
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.items), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups else None}
+
+class SpriteStore:
+    """code.bin and all_sprites.bin memory mapped and the palettes read once, for rendering sprites on request."""
+
+    def __init__(self, code_bin, sprite_bin, palette_bin, raw_palette=False, table_index=None,
+                 cache_bytes=64 * 1024 * 1024, png_level=DEFAULT_PNG_LEVEL):
+        self.table = load_sprite_table(code_bin, table_index)
+        self.sprite_file = map_file(sprite_bin)
+        self.sprite_data = self.sprite_file.data
+        self.palettes = np.frombuffer(load_palette_file(palette_bin, raw=raw_palette), dtype=np.uint8)
+        self.palettes = self.palettes[:len(self.palettes) // 48 * 48].reshape(-1, 16, 3)
+        self.cache = LRUCache(cache_bytes)
+        self.png_level = png_level
+        self.requests = 0
+        self.errors = 0
+        self.render_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.table.close()
+        self.sprite_file.close()
+
+    def lookup(self, index=None, entry_offset=None):
+        """(xsize, ysize, data_offset) from a pointer table sprite number or a code.bin entry offset."""
+        try:
+            row = self.table.sprite(index) if entry_offset is None else self.table.entry(entry_offset)
+        except ValueError as e:
+            raise LookupError(str(e))
+        xsize, ysize, data_offset = int(row['xsize']), int(row['ysize']), int(row['data_offset'])
+        if xsize == 0:
+            raise LookupError("Entry has no sprite (zero width)")
+        if data_offset + (xsize * ysize + 1) // 2 > len(self.sprite_data):
+            raise LookupError(f"Sprite data at 0x{data_offset:X} runs past the end of the sprite file")
+        return xsize, ysize, data_offset
+
+    def render(self, xsize, ysize, data_offset, palette_num, fmt):
+        """(body, content type) for a sprite, from the cache when it's there."""
+        if not 0 <= palette_num < len(self.palettes):
+            raise LookupError(f"Palette {palette_num:02X} is outside the palette file ({len(self.palettes)} palettes)")
+        # raw doesn't depend on the palette, so every palette shares one cached plane
+        key = (data_offset, xsize, ysize, None if fmt == 'raw' else palette_num, fmt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        length = (xsize * ysize + 1) // 2
+        indices = unpack_4bpp(read_view(self.sprite_data, data_offset, length), xsize, ysize)
+        if fmt == 'raw':
+            result = (indices.tobytes(), 'application/octet-stream')
+        else:
+            buffer = io.BytesIO()
+            render_image(indices, self.palettes[palette_num]).save(buffer, 'PNG', compress_level=self.png_level)
+            result = (buffer.getvalue(), 'image/png')
+        with self.lock:
+            self.render_seconds += time.perf_counter() - start
+        self.cache.put(key, result)
+        return result
+
+    def count(self, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+
+    def metrics(self):
+        with self.lock:
+            metrics = {'requests': self.requests, 'errors': self.errors, 'render_seconds': self.render_seconds,
+                       'sprites': len(self.table.pointers), 'palettes': len(self.palettes)}
+        metrics['cache'] = self.cache.metrics()
+        return metrics
+
+class SpriteRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'OutRunSpriteServer/1.0'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            self.send(200, json.dumps(self.server.store.metrics(), indent=1).encode(), 'application/json')
+        elif url.path == '/sprite':
+            self.sprite(parse_qs(url.query))
+        else:
+            self.error(404, f"Unknown path {url.path}, use /sprite or /metrics")
+
+    def sprite(self, query):
+        store = self.server.store
+        try:
+            fmt = query.get('format', ['png'])[0]
+            if fmt not in FORMATS:
+                raise ValueError(f"Unknown format {fmt}, use one of {', '.join(FORMATS)}")
+            if 'palette' not in query:
+                raise ValueError("palette is needed (hex)")
+            palette_num = int(query['palette'][0], 16)
+            if 'entry' in query:
+                sprite = store.lookup(entry_offset=int(query['entry'][0], 16))
+            elif 'index' in query:
+                sprite = store.lookup(index=int(query['index'][0]))
+            else:
+                raise ValueError("index (sprite number) or entry (hex entry offset) is needed")
+            body, content_type = store.render(*sprite, palette_num, fmt)
+        except ValueError as e:
+            return self.error(400, str(e))
+        except LookupError as e:
+            return self.error(404, str(e))
+        xsize, ysize, _ = sprite
+        self.send(200, body, content_type, {'X-Sprite-Width': xsize, 'X-Sprite-Height': ysize})
+
+    def error(self, status, message):
+        self.server.store.count(error=True)
+        self.send(status, json.dumps({'error': message}).encode(), 'application/json', count=False)
+
+    def send(self, status, body, content_type, headers=None, count=True):
+        if count:
+            self.server.store.count()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_server(store, host='127.0.0.1', port=8765, verbose=False):
+    server = ThreadingHTTPServer((host, port), SpriteRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    server.verbose = verbose
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve sprites over HTTP on localhost, with the ROM files loaded once and rendered sprites cached')
+    parser.add_argument('rom_bin', help='ROM file with pointer and dimension tables (code.bin)')
+    parser.add_argument('sprite_bin', help='Joined sprite data binary file (all planes)')
+    parser.add_argument('palette_bin', help='Palette binary file')
+    parser.add_argument('--raw-palette', action='store_true', help='palette_bin is raw 5-5-5 palette RAM (e.g. outrun_palettes.bin) rather than 8-bit RGB')
+    parser.add_argument('--table-index', help='Saved sprite table index (.npy) to use instead of parsing the ROM, made from the ROM if it does not exist yet')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument('--cache-mb', type=float, default=64, help='Most MB of rendered sprites to keep (default: 64)')
+    parser.add_argument('--png-level', type=int, choices=range(10), default=DEFAULT_PNG_LEVEL, metavar='0-9',
+                        help=f'zlib level for the PNGs, 0 is fastest and largest (default: {DEFAULT_PNG_LEVEL})')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    store = SpriteStore(args.rom_bin, args.sprite_bin, args.palette_bin, raw_palette=args.raw_palette, table_index=args.table_index,
+                        cache_bytes=int(args.cache_mb * 1024 * 1024), png_level=args.png_level)
+    server = make_server(store, args.host, args.port, args.verbose)
+    print(f"Serving {len(store.table.pointers)} sprites on http://{args.host}:{server.server_port}/sprite?index=0&palette=00")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+from rom_access import map_file
+from build_manifest import file_digest
+
+TABLE_OFFSET = 0x11ED2        # pointer table of sprite entries
+ENTRY_REGION_START = 0x0F240  # first 10 byte entry, the start of setup_table.csv
+ENTRY_SIZE = 10
+POINTER_SIZE = 4
+
+ENTRY_DTYPE = np.dtype([
+    ('entry_offset', '<u4'),
+    ('xsize', '<u2'),
+    ('ysize', '<u2'),
+    ('bank', 'u1'),
+    ('data_offset', '<u4'),
+    ('length', '<u4'),
+])
+
+def parse_entries(rom, offsets):
+    """Parse the 10 byte sprite entries at each code offset into an ENTRY_DTYPE array."""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    code = np.frombuffer(rom, dtype=np.uint8)
+    raw = code[offsets[:, None] + np.arange(ENTRY_SIZE)]
+    entries = np.zeros(len(offsets), dtype=ENTRY_DTYPE)
+    entries['entry_offset'] = offsets
+    entries['xsize'] = raw[:, 1]
+    entries['ysize'] = raw[:, 3].astype(np.uint16) + 1  # Only Y needs +1 for hardware
+    entries['bank'] = raw[:, 7]
+    offset = (raw[:, 8].astype(np.uint32) << 8) | raw[:, 9]
+    entries['data_offset'] = (raw[:, 7].astype(np.uint32) * 0x10000 + offset) * 4
+    entries['length'] = (entries['xsize'].astype(np.uint32) * entries['ysize'] + 1) // 2
+    return entries
+
+def read_pointer_table(rom, table_offset=TABLE_OFFSET, region_start=ENTRY_REGION_START):
+    """Entry addresses from the pointer table, up to the first long that does not point into the entry region."""
+    count = (len(rom) - table_offset) // POINTER_SIZE
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint32)
+    pointers = np.frombuffer(rom, dtype='>u4', count=count, offset=table_offset).astype(np.uint32)
+    # int64 so the top pointers can't wrap round past the end check
+    ends = pointers.astype(np.int64) + ENTRY_SIZE
+    valid = (pointers >= region_start) & (ends <= min(table_offset, len(rom)))
+    invalid = np.flatnonzero(~valid)
+    return pointers[:invalid[0]] if len(invalid) else pointers
+
+class SpriteTable:
+    """Every 10 byte slot of the entry region plus every pointer table entry, parsed once.
+
+    Lookups by entry offset or sprite index are array indexing, and the table can be saved and
+    memory mapped back in, so code.bin doesn't need reading again.
+    """
+
+    def __init__(self, entries, pointers, rom=None, rom_file=None):
+        self.entries = entries
+        self.pointers = pointers
+        self.rom = rom
+        self.rom_file = rom_file
+        self.region_start = int(entries['entry_offset'][0]) if len(entries) else ENTRY_REGION_START
+
+    @classmethod
+    def from_rom(cls, rom, table_offset=TABLE_OFFSET, region_start=ENTRY_REGION_START):
+        pointer_addrs = read_pointer_table(rom, table_offset, region_start)
+        # Slots run on to the end of the pointer table, setup_table.csv goes as far as its first long
+        last_slot = min(table_offset + len(pointer_addrs) * POINTER_SIZE, len(rom) - ENTRY_SIZE)
+        offsets = np.arange(region_start, last_slot + 1, ENTRY_SIZE)
+        return cls(parse_entries(rom, offsets), parse_entries(rom, pointer_addrs), rom)
+
+    @classmethod
+    def load(cls, path, rom_file=None):
+        """A saved index, with rom_file (the MappedFile of code.bin) for entry offsets that aren't in it."""
+        base = index_base(path)
+        return cls(np.load(base + '.entries.npy', mmap_mode='r'), np.load(base + '.pointers.npy', mmap_mode='r'),
+                   rom_file.data if rom_file is not None else None, rom_file)
+
+    def save(self, path, source=None):
+        """Save the index, with the size and digest of the code.bin it came from when source is given."""
+        base = index_base(path)
+        np.save(base + '.entries.npy', np.asarray(self.entries))
+        np.save(base + '.pointers.npy', np.asarray(self.pointers))
+        if source is not None:
+            with open(base + '.source.json', 'w') as f:
+                json.dump(source_info(source), f, indent=1)
+
+    def close(self):
+        """Close the code.bin map, entry offsets that aren't a slot of the table can't be looked up after this."""
+        self.rom = None
+        if self.rom_file is not None:
+            self.rom_file.close()
+            self.rom_file = None
+
+    def entry(self, entry_offset):
+        """The parsed row for a code.bin entry offset."""
+        slot, rem = divmod(entry_offset - self.region_start, ENTRY_SIZE)
+        if rem == 0 and 0 <= slot < len(self.entries):
+            return self.entries[slot]
+        if entry_offset < 0:
+            raise ValueError(f"Entry offset {entry_offset} is negative")
+        if self.rom is not None:
+            if entry_offset + ENTRY_SIZE > len(self.rom):
+                raise ValueError(f"Entry offset 0x{entry_offset:06X} out of ROM bounds")
+            return parse_entries(self.rom, [entry_offset])[0]
+        raise ValueError(f"Entry offset 0x{entry_offset:06X} is not in the sprite table index")
+
+    def sprite_entry(self, entry_offset):
+        """(xsize, ysize, data_offset) for a code.bin entry offset."""
+        row = self.entry(entry_offset)
+        return int(row['xsize']), int(row['ysize']), int(row['data_offset'])
+
+    def sprite(self, index):
+        """The parsed row for a sprite number in the pointer table."""
+        if not 0 <= index < len(self.pointers):
+            raise ValueError(f"Sprite index {index} is outside the pointer table ({len(self.pointers)} entries)")
+        return self.pointers[index]
+
+def index_base(path):
+    return path[:-4] if path.endswith('.npy') else path
+
+def source_info(code_bin):
+    return {'size': os.path.getsize(code_bin), 'mtime': os.path.getmtime(code_bin), 'blake2b': file_digest(code_bin)}
+
+def index_matches(index_file, code_bin):
+    """True when a saved index was made from this code.bin.
+
+    A matching size and modified time is taken as the same file, so a repeated run doesn't read code.bin
+    at all. Only when the time differs is the digest checked, and the saved time brought up to date when
+    the contents turn out to be the same.
+    """
+    base = index_base(index_file)
+    if not os.path.exists(base + '.entries.npy') or not os.path.exists(base + '.pointers.npy'):
+        return False
+    try:
+        with open(base + '.source.json') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if saved.get('size') != os.path.getsize(code_bin):
+        return False
+    if saved.get('mtime') == os.path.getmtime(code_bin):
+        return True
+    if saved.get('blake2b') != file_digest(code_bin):
+        return False
+    saved['mtime'] = os.path.getmtime(code_bin)
+    with open(base + '.source.json', 'w') as f:
+        json.dump(saved, f, indent=1)
+    return True
+
+def load_sprite_table(code_bin, index_file=None):
+    """Use a saved index made from this code.bin when there is one, otherwise parse code.bin (and save the index if a name was given).
+
+    code.bin is mapped either way, so entry offsets off the table are parsed from it the same with or without an index.
+    """
+    rom_file = map_file(code_bin)
+    if index_file and index_matches(index_file, code_bin):
+        return SpriteTable.load(index_file, rom_file)
+    table = SpriteTable.from_rom(rom_file.data)
+    table.rom_file = rom_file
+    if index_file:
+        if os.path.exists(index_base(index_file) + '.entries.npy'):
+            print(f"Sprite table index {index_base(index_file)} was not made from this {code_bin}, rebuilding it")
+        table.save(index_file, source=code_bin)
+        print(f"Sprite table index saved to {index_base(index_file)}.entries.npy / .pointers.npy")
+    return table
+
+def load_sprite_csv(csv_file):
+    """(entry_offset, [palette numbers]) for each row of a setup_table.csv style CSV, header rows skipped."""
+    entries = []
+    with open(csv_file, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if not row or not row[0]:
+                continue
+            # Skip header row
+            if row[0].strip().lower().startswith('hex') or row[0].strip().lower().startswith('off'):
+                continue
+            try:
+                entry_offset = int(row[0].strip(), 16)
+            except Exception as e:
+                print(f"Skipping row {row}: {e}")
+                continue
+            # Flatten all palette fields (split if needed)
+            palette_fields = []
+            for p in row[1:]:
+                for sub_p in p.split(','):
+                    if sub_p.strip():
+                        palette_fields.append(sub_p.strip())
+            palettes = [int(p, 16) for p in palette_fields]
+            entries.append((entry_offset, palettes))
+    return entries
+
+def discover_variations(sprite_entries, table, sprite_size):
+    """Follow each setup_table.csv entry on through the scale variations that come after it.
+
+    A table of variations ends at the next CSV entry (a palette change) or at a zero width
+    terminator, and entries whose pixels fall outside all_sprites.bin are left out.
+    """
+    sprite_entries = sorted(sprite_entries, key=lambda x: x[0])
+    entries = table.entries
+    xsize = np.asarray(entries['xsize'])
+    data_end = np.asarray(entries['data_offset'], dtype=np.int64) + np.asarray(entries['length'])
+    valid = (xsize > 0) & (data_end <= sprite_size)
+    terminators = np.flatnonzero(xsize == 0)
+
+    result = []
+    for i, (entry_offset, palettes) in enumerate(sprite_entries):
+        slot, rem = divmod(entry_offset - table.region_start, ENTRY_SIZE)
+        if rem or not 0 <= slot < len(entries):
+            # Not on the entry table, keep it as given and let the tools check it
+            result.append((entry_offset, palettes))
+            continue
+        stop = len(entries)
+        if i + 1 < len(sprite_entries):
+            stop = min(stop, -(-(sprite_entries[i + 1][0] - table.region_start) // ENTRY_SIZE))
+        t = np.searchsorted(terminators, slot)
+        if t < len(terminators):
+            stop = min(stop, terminators[t])
+        for found in np.flatnonzero(valid[slot:stop]) + slot:
+            result.append((table.region_start + int(found) * ENTRY_SIZE, palettes))
+    return result
+
+def variations_key(sprite_entries, table, sprite_size):
+    digest = hashlib.sha1(repr((sorted(sprite_entries), sprite_size)).encode())
+    digest.update(np.ascontiguousarray(table.entries).tobytes())
+    return digest.hexdigest()
+
+def load_variations(sprite_entries, table, sprite_size, cache_file=None):
+    """discover_variations, reusing a cache CSV when it was made from the same inputs.
+
+    The cache is written in the setup_table.csv layout, so it can be used as an input CSV itself.
+    """
+    key = variations_key(sprite_entries, table, sprite_size)
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file, newline='') as f:
+            rows = list(csv.reader(f))
+        if rows and rows[0][-1] == f"key {key}":
+            return [(int(row[0], 16), [int(p, 16) for p in row[1:] if p]) for row in rows[1:] if row]
+
+    variations = discover_variations(sprite_entries, table, sprite_size)
+    print(f"Found {len(variations)} sprite variations from {len(sprite_entries)} CSV entries")
+    if cache_file:
+        with open(cache_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Hex off", "Palette", f"key {key}"])
+            for entry_offset, palettes in variations:
+                writer.writerow([f"{entry_offset:05X}"] + [f"{p:02x}" for p in palettes])
+        print(f"Variations saved to {cache_file}")
+    return variations
@@ -0,0 +1,122 @@
+import argparse
+import numpy as np
+from PIL import Image
+from rom_access import map_file, read_view
+from sprite_decode import unpack_4bpp, render_image, render_rgba
+from palette5bit_to_8bit import load_palette_file, read_palette
+from sprite_table import load_sprite_table
+
+# Zoom the way the sprite hardware steps through a line: an accumulator goes up by the zoom for every pixel
+# drawn and its top bits pick the source pixel, so output pixel i shows source pixel (i * zoom) >> 9.
+# ZOOM_ONE is 1:1, twice it draws every other pixel (half size) and half of it draws every pixel twice.
+# Lines and rows step the same way, with their own zoom. A zoomed sprite is its decoded index plane with those
+# rows, then those columns, picked out, so every zoom of a sprite costs one unpack and two takes.
+ZOOM_SHIFT = 9
+ZOOM_ONE = 1 << ZOOM_SHIFT  # 0x200
+MIN_ZOOM = 0x40             # 8 times magnified, smaller zooms are clamped to it
+
+def zoomed_size(size, zoom):
+    """Pixels drawn for size source pixels at a zoom, every step that still lands inside the source."""
+    zoom = max(int(zoom), MIN_ZOOM)
+    return max(1, -(-size * ZOOM_ONE // zoom))
+
+def source_steps(size, zoom, flip=False):
+    """Source pixel of each drawn pixel, read from the far end when flipped like the hardware does."""
+    zoom = max(int(zoom), MIN_ZOOM)
+    steps = (np.arange(zoomed_size(size, zoom), dtype=np.int64) * zoom) >> ZOOM_SHIFT
+    return size - 1 - steps if flip else steps
+
+def zoom_plane(indices, hzoom, vzoom=None, hflip=False):
+    """A decoded (ysize, xsize) index plane drawn at a zoom, vzoom is hzoom unless given."""
+    ysize, xsize = indices.shape
+    rows = source_steps(ysize, hzoom if vzoom is None else vzoom)
+    return indices.take(rows, axis=0).take(source_steps(xsize, hzoom, hflip), axis=1)
+
+def zoom_indices(sprite_bytes, xsize, ysize, hzoom, vzoom=None, hflip=False):
+    """Index plane of packed 4bpp sprite data drawn at a zoom."""
+    return zoom_plane(unpack_4bpp(sprite_bytes, xsize, ysize), hzoom, vzoom, hflip)
+
+def zoom_batch(sprite_bytes, xsize, ysize, zooms, hflip=False):
+    """Index planes of a sprite at many zooms (hzoom or (hzoom, vzoom) each), the sprite is decoded once for all of them."""
+    indices = unpack_4bpp(sprite_bytes, xsize, ysize)
+    return [zoom_plane(indices, *(zoom if isinstance(zoom, tuple) else (zoom,)), hflip=hflip) for zoom in zooms]
+
+def zoom_rgba(sprite_bytes, xsize, ysize, palette, hzoom, vzoom=None, hflip=False):
+    return render_rgba(zoom_indices(sprite_bytes, xsize, ysize, hzoom, vzoom, hflip), palette)
+
+def zoom_strip(planes, palette, gap=4):
+    """The planes side by side on their bottom edges, as the road scenery grows towards the player."""
+    width = sum(plane.shape[1] for plane in planes) + gap * max(len(planes) - 1, 0)
+    height = max(plane.shape[0] for plane in planes)
+    strip = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    x = 0
+    for plane in planes:
+        strip.paste(render_image(plane, palette), (x, height - plane.shape[0]))
+        x += plane.shape[1] + gap
+    return strip
+
+def parse_zoom(text):
+    """A zoom in hex (0x200, 200) or as a scale (1.5x)."""
+    if text.lower().endswith('x'):
+        scale = float(text[:-1])
+        if not scale > 0:
+            raise argparse.ArgumentTypeError(f"scale {text} is not more than 0")
+        return max(MIN_ZOOM, round(ZOOM_ONE / scale))
+    zoom = int(text, 16)
+    if zoom <= 0:
+        raise argparse.ArgumentTypeError(f"zoom {text} is not more than 0")
+    return zoom
+
+def step_count(text):
+    steps = int(text)
+    if steps < 1:
+        raise argparse.ArgumentTypeError(f"{steps} steps, a strip needs at least 1")
+    return steps
+
+def main():
+    parser = argparse.ArgumentParser(description='Draw a sprite at any zoom the way the sprite hardware steps through it, or a strip of zooms')
+    parser.add_argument('code_bin', help='Game code binary (with pointer and dimension tables)')
+    parser.add_argument('sprite_bin', help='Sprite data binary')
+    parser.add_argument('palette_bin', help='Palette binary')
+    parser.add_argument('entry_offset', type=lambda x: int(x, 16), help='code.bin entry offset (hex)')
+    parser.add_argument('palette_num', type=lambda x: int(x, 16), help='Palette number (hex)')
+    parser.add_argument('output_png', help='Output PNG filename')
+    parser.add_argument('--zoom', type=parse_zoom, action='append',
+                        help=f'Zoom in hex, {ZOOM_ONE:X} is 1:1 and bigger is smaller, or a scale like 0.5x. More than one makes a strip (default: {ZOOM_ONE:X})')
+    parser.add_argument('--vzoom', type=parse_zoom, help='Vertical zoom when it differs from the horizontal one')
+    parser.add_argument('--steps', type=step_count, help='Strip of this many zooms evenly from the first --zoom to the second')
+    parser.add_argument('--hflip', action='store_true', help='Flip horizontally')
+    parser.add_argument('--table-index', help='Saved sprite table index (.npy) to use instead of parsing code.bin, made from code.bin if it does not exist yet')
+    parser.add_argument('--raw-palette', action='store_true', help='palette_bin is raw 5-5-5 palette RAM (e.g. outrun_palettes.bin) rather than 8-bit RGB')
+    args = parser.parse_args()
+
+    zooms = args.zoom or [ZOOM_ONE]
+    if args.steps:
+        if len(zooms) != 2:
+            parser.error('--steps needs two --zoom values, the first and last')
+        zooms = [int(round(z)) for z in np.linspace(zooms[0], zooms[1], args.steps)]
+    if args.vzoom is not None:
+        zooms = [(zoom, args.vzoom) for zoom in zooms]
+
+    sprite_table = load_sprite_table(args.code_bin, args.table_index)
+    try:
+        xsize, ysize, data_offset = sprite_table.sprite_entry(args.entry_offset)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        sprite_table.close()
+    if xsize == 0 or ysize == 0:
+        parser.error(f"Entry {args.entry_offset:X} has no sprite (zero width)")
+    try:
+        palette = read_palette(load_palette_file(args.palette_bin, raw=args.raw_palette), args.palette_num)
+        with map_file(args.sprite_bin) as sprite_data:
+            planes = zoom_batch(read_view(sprite_data, data_offset, (xsize * ysize + 1) // 2), xsize, ysize, zooms, args.hflip)
+    except ValueError as e:
+        parser.error(f"Entry {args.entry_offset:X}: {e}")
+    image = render_image(planes[0], palette) if len(planes) == 1 else zoom_strip(planes, palette)
+    image.save(args.output_png)
+    sizes = ", ".join(f"{plane.shape[1]}x{plane.shape[0]}" for plane in planes)
+    print(f"Sprite {args.entry_offset:X} ({xsize}x{ysize}) drawn at {sizes}, saved to {args.output_png}")
+
+if __name__ == '__main__':
+    main()
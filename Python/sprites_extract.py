@@ -1,154 +1,185 @@
 import argparse
-from PIL import Image
 import sys
 import csv
 import os
-
-ENTRY_SIZE = 10
-
-def read_long(data, offset):
-    return int.from_bytes(data[offset:offset+4], 'big')
-
-def get_sprite_table_entry(rom, entry_offset):
-    if entry_offset + ENTRY_SIZE > len(rom):
-        raise ValueError(f"Entry offset 0x{entry_offset:06X} out of ROM bounds")
-    xsize      = rom[entry_offset+1]
-    ysize      = rom[entry_offset+3] + 1
-    bank       = rom[entry_offset+7]
-    offset     = (rom[entry_offset+8] << 8) | rom[entry_offset+9]
-    fulloffset = (bank * 0x10000 + offset) * 4
-    return xsize, ysize, fulloffset
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sprite_decode import unpack_4bpp, render_image, render_indexed_image, sprite_digest, opaque_bounds
+from palette5bit_to_8bit import load_palette_file, read_palette
+from sprite_table import load_sprite_table, load_variations, load_sprite_csv
+from sprite_pack import write_pack
+from build_manifest import load_manifest, save_manifest
+from profiling import Profiler, add_profile_arguments
+from image_writer import ImageWriter, add_writer_arguments
+from rom_access import map_file, read_view
 
 def read_sprite_data(sprite_bin, offset, xsize, ysize):
     sprite_size = (xsize * ysize + 1) // 2
-    return sprite_bin[offset:offset + sprite_size]
-
-def read_palette(palette_bin, palette_num):
-    palette_offset = palette_num * 16 * 3
-    palette_bytes = palette_bin[palette_offset:palette_offset + 16 * 3]
-    return [(palette_bytes[i*3], palette_bytes[i*3+1], palette_bytes[i*3+2]) for i in range(16)]
-
-def load_sprite_csv(csv_file):
-    entries = []
-    with open(csv_file, encoding='utf-8-sig', newline='') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row or not row[0]:
-                continue
-            # Skip header row
-            if row[0].strip().lower().startswith('hex') or row[0].strip().lower().startswith('off'):
-                continue
-            try:
-                entry_offset = int(row[0].strip(), 16)
-            except Exception as e:
-                print(f"Skipping row {row}: {e}")
-                continue
-            # Flatten all palette fields (split if needed)
-            palette_fields = []
-            for p in row[1:]:
-                for sub_p in p.split(','):
-                    if sub_p.strip():
-                        palette_fields.append(sub_p.strip())
-            palettes = [int(p, 16) for p in palette_fields]
-            entries.append((entry_offset, palettes))
-    return entries
-
-def build_full_variation_entries(sprite_entries, entry_size=10):
-    if not sprite_entries:
-        return []
-    sprite_entries = sorted(sprite_entries, key=lambda x: x[0])
-    offset_to_palettes = {off: palettes for off, palettes in sprite_entries}
-    min_offset = sprite_entries[0][0]
-    max_offset = sprite_entries[-1][0]
-    result = []
-    last_palettes = None
-    for off in range(min_offset, max_offset + 1, entry_size):
-        palettes = offset_to_palettes.get(off)
-        if palettes is not None:
-            last_palettes = palettes
-        if last_palettes is not None:
-            result.append((off, last_palettes))
-    return result
-
-def create_sprite_image(sprite_bytes, palette, xsize, ysize):
-    img = Image.new('RGBA', (xsize, ysize))
-    pixels = []
-    for i in range(xsize * ysize):
-        byte_pos = i // 2
-        if i % 2 == 0:
-            color_index = (sprite_bytes[byte_pos] >> 4) & 0x0F
+    if offset + sprite_size > len(sprite_bin):
+        raise ValueError(f"Sprite data too short: have {max(len(sprite_bin) - offset, 0)} bytes, need {sprite_size}")
+    return read_view(sprite_bin, offset, sprite_size)
+
+def job_count(text):
+    jobs = int(text)
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(f"{jobs} jobs, use 0 for every core or a positive count")
+    return jobs
+
+# all_sprites.bin for render_sprite_files in the worker processes. Each worker maps the file itself, so tasks
+# carry offsets rather than pickled copies of the pixels, and the map goes when the worker exits
+worker_sprite_data = None
+
+def init_worker(sprite_bin):
+    global worker_sprite_data
+    worker_sprite_data = map_file(sprite_bin).data
+
+def render_sprite_files(task, sprite_data=None):
+    """Decode one sprite and save a PNG for each of its palettes, run in the worker processes with --jobs.
+
+    sprite_data is all_sprites.bin when run in this process, the workers use the one they mapped.
+
+    With trim only the (left, top, width, height) box around the opaque pixels is saved, it's found here
+    from the same decode so trimming runs in the workers too. Returns the seconds it took, for --profile,
+    the seconds and bytes of the saving and the box (the whole sprite without trim).
+    """
+    start = time.perf_counter()
+    data_offset, xsize, ysize, outputs, bit16, writer, trim = task
+    if sprite_data is None:
+        sprite_data = worker_sprite_data
+    indices = unpack_4bpp(read_sprite_data(sprite_data, data_offset, xsize, ysize), xsize, ysize)
+    box = opaque_bounds(indices) if trim else (0, 0, xsize, ysize)
+    left, top, width, height = box
+    indices = indices[top:top + height, left:left + width]
+    encode_seconds = encode_bytes = 0
+    for palette, out_path in outputs:
+        if writer.encoder != 'png':
+            seconds, size = writer.write_indices(indices, out_path, palette)
         else:
-            color_index = sprite_bytes[byte_pos] & 0x0F
-        if color_index in (0, 15):
-            pixels.append((0, 0, 0, 0))
-        else:
-            r, g, b = palette[color_index]
-            pixels.append((r, g, b, 255))
-    img.putdata(pixels)
-    return img
-
-def save_all_sprites(code_bin, sprite_bin, palette_bin, sprite_entries, output_folder, bit16=False):
-    with open(code_bin, 'rb') as f:
-        code_data = f.read()
-    with open(sprite_bin, 'rb') as f:
-        sprite_data = f.read()
-    with open(palette_bin, 'rb') as f:
-        palette_data = f.read()
+            if bit16:
+                # 4bpp indexed PNG (palette mode 'P'), with color 15 remapped to 0
+                sprite_img = render_indexed_image(indices, palette)
+            else:
+                sprite_img = render_image(indices, palette)
+            seconds, size = writer.write_image(sprite_img, out_path)
+        encode_seconds += seconds
+        encode_bytes += size
+    return time.perf_counter() - start, encode_seconds, encode_bytes, box
+
+def save_all_sprites(code_bin, sprite_bin, palette_bin, sprite_entries, output_folder, bit16=False, raw_palette=False, jobs=1, table_index=None,
+                     variations=False, variations_cache=None, dedupe=False, output_format='png',
+                     incremental=False, trim=False, profiler=None, writer=None):
+    profiler = profiler or Profiler('sprites_extract')
+    writer = writer or ImageWriter()
+    with profiler.stage('load'):
+        sprite_table = load_sprite_table(code_bin, table_index)
+        sprite_file = map_file(sprite_bin)
+        sprite_data = sprite_file.data
+        if variations:
+            sprite_entries = load_variations(sprite_entries, sprite_table, len(sprite_data), variations_cache)
+        palette_data = load_palette_file(palette_bin, raw=raw_palette)
 
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    sprite_info_list = []
-    index = 0
-    for entry_offset, palette_nums in sprite_entries:
-        try:
-            xsize, ysize, data_offset = get_sprite_table_entry(code_data, entry_offset)
-            if xsize > 0 and ysize > 0:
-                for palette_num in palette_nums:
-                    palette = read_palette(palette_data, palette_num)
-                    sprite_bytes = read_sprite_data(sprite_data, data_offset, xsize, ysize)
-                    filename = f"Sprite_{index+1:04d}_{palette_num}.png"
-                    out_path = os.path.join(output_folder, filename)
-
-                    if bit16:
-                        # 4bpp indexed PNG (palette mode 'P'), with color 15 remapped to 0
-                        flat_palette = []
-                        for (r, g, b) in palette:
-                            flat_palette.extend([r, g, b])
-                        while len(flat_palette) < 256 * 3:
-                            flat_palette.append(0)
-                        index_data = []
-                        for i in range(xsize * ysize):
-                            byte_pos = i // 2
-                            if i % 2 == 0:
-                                color_index = (sprite_bytes[byte_pos] >> 4) & 0x0F
+    # File numbering and the table are worked out up front, so they match whatever order the workers finish in.
+    # Sprites sharing (data_offset, xsize, ysize) are one task, decoded once for all of their palettes.
+    # With dedupe, a sprite that makes the same image as an earlier one gets that ones file in the table instead of its own.
+    # With incremental, a file is only saved again when the digest of its pixels and palette differs from the last run.
+    # With trim, only the box around the opaque pixels is saved and the table says where it sits in the sprite, the box is
+    # found by the task as it decodes the sprite.
+    manifest_file = os.path.join(output_folder, "sprite_manifest.json")
+    previous = load_manifest(manifest_file) if incremental else {}
+    current = {}
+    unchanged = 0
+    with profiler.stage('plan'):
+        tasks = {}
+        sprite_info_list = []
+        pack_sprites = []
+        files = {}
+        index = 0
+        for entry_offset, palette_nums in sprite_entries:
+            try:
+                xsize, ysize, data_offset = sprite_table.sprite_entry(entry_offset)
+                if xsize > 0 and ysize > 0:
+                    # Checked here so a sprite running past the end of the data never gets a task
+                    read_sprite_data(sprite_data, data_offset, xsize, ysize)
+                    key = (data_offset, xsize, ysize)
+                    task = tasks.get(key)
+                    if task is None:
+                        task = (data_offset, xsize, ysize, [], bit16, writer, trim)
+                        tasks[key] = task
+                    for palette_num in palette_nums:
+                        palette = read_palette(palette_data, palette_num)
+                        if dedupe or incremental:
+                            digest = sprite_digest(read_sprite_data(sprite_data, data_offset, xsize, ysize), xsize, ysize, palette)
+                        else:
+                            digest = None
+                        filename = files.get(digest)
+                        if filename is None:
+                            filename = f"Sprite_{index+1:04d}_{palette_num}{writer.extension}"
+                            out_path = os.path.join(output_folder, filename)
+                            current[filename] = f"{digest}-{writer.key}{'-16' if bit16 else ''}{'-trim' if trim else ''}"
+                            if previous.get(filename) == current[filename] and os.path.exists(out_path):
+                                unchanged += 1
                             else:
-                                color_index = sprite_bytes[byte_pos] & 0x0F
-                            if color_index == 15:
-                                color_index = 0  # Map 15 to 0 for transparency
-                            index_data.append(color_index)
-                        img_p = Image.new('P', (xsize, ysize))
-                        img_p.putdata(index_data)
-                        img_p.putpalette(flat_palette)
-                        img_p.info['transparency'] = 0  # only palette index 0 transparent
-                        img_p.save(out_path)
-                    else:
-                        sprite_img = create_sprite_image(sprite_bytes, palette, xsize, ysize)
-                        sprite_img.save(out_path)
-
-                    sprite_info_list.append((filename, xsize, ysize, palette_num))
-                    index += 1
-        except Exception as e:
-            print(f"Skipping code offset {entry_offset:X}: {str(e)}")
+                                task[3].append((palette, out_path))
+                            index += 1
+                            if dedupe:
+                                files[digest] = filename
+                        sprite_info_list.append((filename, key, palette_num, f"{entry_offset:X}"))
+                        pack_sprites.append((entry_offset, xsize, ysize, palette_num, data_offset))
+            except Exception as e:
+                print(f"Skipping code offset {entry_offset:X}: {str(e)}")
+    sprite_table.close()
+
+    if output_format == 'pack':
+        # The pack index holds what sprite_table.csv would, sprite_pack.py lists it
+        pack_path = os.path.join(output_folder, "sprites.pack")
+        with profiler.stage('pack'):
+            planes = write_pack(pack_path, pack_sprites, sprite_data, palette_data, bits=4 if bit16 else 8)
+        sprite_file.close()
+        profiler.count('pack', len(pack_sprites), sum(xsize * ysize for _, xsize, ysize, _, _ in pack_sprites))
+        print(f"Packed {len(pack_sprites)} sprites ({planes} index planes) into {pack_path}")
+        return
+
+    # With trim every sprite is decoded once for its box, even when none of its files need saving
+    tasks = [task for task in tasks.values() if task[3] or trim]
+    with profiler.stage('render'):
+        if jobs == 1:
+            times = [render_sprite_files(task, sprite_data) for task in tasks]
+        else:
+            # Memory of the worker processes is not in the report, only their times
+            with ProcessPoolExecutor(max_workers=jobs or None, initializer=init_worker, initargs=(sprite_bin,)) as executor:
+                times = list(executor.map(render_sprite_files, tasks, chunksize=16))
+    sprite_file.close()
+    boxes = {}
+    for (data_offset, xsize, ysize, outputs, _, _, _), (seconds, encode_seconds, encode_bytes, box) in zip(tasks, times):
+        boxes[(data_offset, xsize, ysize)] = box
+        if outputs:
+            profiler.sprite('render', os.path.basename(outputs[0][1]), seconds, box[2] * box[3] * len(outputs))
+            writer.add(encode_seconds, encode_bytes, len(outputs))
+    print(writer.summary())
+
+    if incremental:
+        # Files from the last run that nothing is saved to this time
+        for filename in previous:
+            if filename not in current and os.path.exists(os.path.join(output_folder, filename)):
+                os.remove(os.path.join(output_folder, filename))
+        save_manifest(manifest_file, current)
+        print(f"Saved {len(current) - unchanged} changed sprites, {unchanged} unchanged")
 
     # Write summary CSV
     table_path = os.path.join(output_folder, "sprite_table.csv")
-    with open(table_path, "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["filename", "xsize", "ysize", "palette"])
-        for info in sprite_info_list:
-            writer.writerow(info)
+    with profiler.stage('table'), open(table_path, "w", newline="") as csvfile:
+        table_writer = csv.writer(csvfile)
+        # xsize and ysize are the saved image, trim_x/y where it sits in the sprite_xsize x sprite_ysize sprite
+        table_writer.writerow(["filename", "xsize", "ysize", "palette", "entry_offset", "trim_x", "trim_y", "sprite_xsize", "sprite_ysize"])
+        for filename, (data_offset, xsize, ysize), palette_num, entry_offset in sprite_info_list:
+            left, top, width, height = boxes.get((data_offset, xsize, ysize), (0, 0, xsize, ysize))
+            table_writer.writerow((filename, width, height, palette_num, entry_offset, left, top, xsize, ysize))
     print("Sprite info table written to sprite_table.csv")
+    if dedupe:
+        print(f"Deduplicated {len(sprite_info_list)} sprites to {index} unique images")
 
 def main():
     parser = argparse.ArgumentParser(description='Save each sprite as a separate PNG (RGBA or 4bpp indexed) and output a table')
@@ -157,13 +188,29 @@ def main():
     parser.add_argument('palette_bin', help='Palette binary')
     parser.add_argument('offset_palette_csv', help='CSV with code.bin entry offsets and palette(s) for each sprite')
     parser.add_argument('output_folder', help='Output folder for separate PNGs')
-    parser.add_argument('--variations', action='store_true', help='If set, process every entry from min to max offset, using most recent palette')
+    parser.add_argument('--variations', action='store_true', help='Also process the scale variations found after each CSV entry, using its palettes')
+    parser.add_argument('--dedupe', action='store_true', help='Save each unique image once, sprite_table.csv points duplicates at that file')
+    parser.add_argument('--variations-cache', help='CSV to keep the found variations in, reused while code.bin, the sprite binary and the CSV are unchanged')
+    parser.add_argument('--table-index', help='Saved sprite table index (.npy) to use instead of parsing code.bin, made from code.bin if it does not exist yet')
+    parser.add_argument('--raw-palette', action='store_true', help='palette_bin is raw 5-5-5 palette RAM (e.g. outrun_palettes.bin) rather than 8-bit RGB')
     parser.add_argument('-16', dest='bit16', action='store_true', help='Save PNGs as 4-bit indexed (palette) format')
+    parser.add_argument('--format', dest='output_format', choices=['png', 'pack'], default='png', help='png: a file per sprite, pack: one sprites.pack of raw index planes for sprite_pack.py, 4bpp with -16 (default: png)')
+    parser.add_argument('--incremental', action='store_true', help='Only save sprites whose pixels or palette changed since the last run into this folder')
+    parser.add_argument('--trim', action='store_true', help='Save only the box around the opaque pixels of each sprite, sprite_table.csv gives where it sits in the sprite (not for --format pack)')
+    parser.add_argument('--jobs', type=job_count, default=1, help='Worker processes for decoding and PNG encoding, 0 uses every core (default: 1)')
+    add_writer_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    sprite_entries = load_sprite_csv(args.offset_palette_csv)
-
-    if args.variations:
-        sprite_entries = build_full_variation_entries(sprite_entries)
+    # -16 and --format pack pick the output themselves, --encoder would be ignored
+    if args.encoder != 'png' and args.bit16:
+        parser.error(f"-16 saves 4-bit indexed PNGs, it can't be used with --encoder {args.encoder}")
+    if args.encoder != 'png' and args.output_format == 'pack':
+        parser.error(f"--format pack saves raw index planes itself, it can't be used with --encoder {args.encoder}")
+    if args.trim and args.output_format == 'pack':
+        parser.error("--trim can't be used with --format pack, the pack keeps whole sprites")
+    profiler = Profiler.from_args('sprites_extract', args)
+    with profiler.stage('load'):
+        sprite_entries = load_sprite_csv(args.offset_palette_csv)
 
     save_all_sprites(
         args.code_bin,
@@ -171,8 +218,20 @@ def main():
         args.palette_bin,
         sprite_entries,
         args.output_folder,
-        bit16=args.bit16
+        bit16=args.bit16,
+        raw_palette=args.raw_palette,
+        jobs=args.jobs,
+        table_index=args.table_index,
+        variations=args.variations,
+        variations_cache=args.variations_cache,
+        dedupe=args.dedupe,
+        output_format=args.output_format,
+        incremental=args.incremental,
+        trim=args.trim,
+        profiler=profiler,
+        writer=ImageWriter.from_args(args)
     )
+    profiler.close()
 
 if __name__ == '__main__':
     main()
@@ -1,24 +1,59 @@
-import sys
+import argparse
+import mmap
+import os
+
+CHUNK_SIZE = 1024 * 1024
 
 def swap_nibble(byte):
     return ((byte & 0x0F) << 4 | (byte & 0xF0) >> 4)
 
-def process_file(input_file):
-    with open(input_file, 'rb') as f:
-        data = f.read()
+# Every byte value with its high and low 4bits swapped, for bytes.translate
+SWAP_TABLE = bytes(swap_nibble(byte) for byte in range(256))
+
+def swap_nibbles(data):
+    """Swap the nibbles of every byte in a bytes or bytearray buffer."""
+    return data.translate(SWAP_TABLE)
+
+def swap_file_in_place(input_file, chunk_size=CHUNK_SIZE):
+    """Swap a file through a writable memory map, a chunk at a time."""
+    with open(input_file, 'r+b') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0) as mm:
+            for start in range(0, size, chunk_size):
+                end = min(start + chunk_size, size)
+                mm[start:end] = mm[start:end].translate(SWAP_TABLE)
+            mm.flush()
+
+def swap_file_streaming(input_file, output_file, chunk_size=CHUNK_SIZE):
+    """Swap a file into a new one, holding no more than one chunk in memory."""
+    with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dst.write(chunk.translate(SWAP_TABLE))
 
-    swapped_data = bytes(swap_nibble(byte) for byte in data)
+def process_file(input_file, output_file=None, in_place=False, chunk_size=CHUNK_SIZE):
+    if in_place:
+        swap_file_in_place(input_file, chunk_size)
+        print(f"Processed file {input_file} in place")
+        return
 
-    output_file = 'swapped_' + input_file
-    with open(output_file, 'wb') as f:
-        f.write(swapped_data)
+    if output_file is None:
+        folder, name = os.path.split(input_file)
+        output_file = os.path.join(folder, 'swapped_' + name)
+    swap_file_streaming(input_file, output_file, chunk_size)
 
     print(f"Processed file saved as {output_file}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python swapnibble.py input.bin")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Swap the high and low 4bits of every byte in a file')
+    parser.add_argument('input_file', help='Input binary, e.g. all_sprites.bin')
+    parser.add_argument('--output', help='Output file (default: swapped_ + input name)')
+    parser.add_argument('--in-place', action='store_true', help='Swap the input file itself through a memory map')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help=f'Bytes processed per step (default: {CHUNK_SIZE})')
+    args = parser.parse_args()
 
-    input_file = sys.argv[1]
-    process_file(input_file)
+    process_file(args.input_file, args.output, in_place=args.in_place, chunk_size=args.chunk_size)
@@ -0,0 +1,121 @@
+import argparse
+import os
+import numpy as np
+from build_roms import CODE_PARTS, SPRITE_PARTS, PALETTE_OFFSET, PALETTE_LENGTH, build_roms, write_files
+from rom_utils import deinterleave
+from sprite_table import TABLE_OFFSET, ENTRY_REGION_START, ENTRY_SIZE, POINTER_SIZE
+
+# Made up ROM sets in the real formats, so the tools can be run and timed without the SEGA ROMs:
+#   10 byte entries (xsize, ysize-1, bank and word offset) in the entry region, each table of scale variations
+#   ending with an all zero entry, the pointer table after them, 5-5-5 palette words at PALETTE_OFFSET,
+#   and 4bpp sprites (high nibble first) with colour 15 ending every line, split over the ROM files in
+#   the order build_roms.py joins them.
+
+def make_sprite(rng, xsize, ysize):
+    """A packed 4bpp sprite, an oval of stripes on colour 0 with colour 15 at the end of each line."""
+    y, x = np.mgrid[0:ysize, 0:xsize]
+    inside = ((x - xsize / 2 + 0.5) / (xsize / 2)) ** 2 + ((y - ysize / 2 + 0.5) / (ysize / 2)) ** 2 <= 1
+    stripes = (x // int(rng.integers(2, 6)) + y // int(rng.integers(2, 6)) + int(rng.integers(14))) % 14 + 1
+    indices = np.where(inside, stripes, 0).astype(np.uint8)
+    indices[:, -1] = 15
+    flat = indices.reshape(-1)
+    if len(flat) & 1:
+        flat = np.append(flat, 0)
+    return ((flat[0::2] << 4) | flat[1::2]).astype(np.uint8).tobytes()
+
+def generate(seed=1, tables=150, max_variations=6, max_size=96, code_rom_size=0x10000, sprite_rom_size=0x20000):
+    """Returns ({rom file name: bytes}, setup_table.csv text)."""
+    rng = np.random.default_rng(seed)
+    code = bytearray(rng.integers(0, 256, size=code_rom_size * 4, dtype=np.uint8).tobytes())
+    sprites = bytearray(sprite_rom_size * len(SPRITE_PARTS) * len(SPRITE_PARTS[0][1]))
+    if len(code) < PALETTE_OFFSET + PALETTE_LENGTH:
+        raise ValueError(f"Code ROMs of 0x{code_rom_size:X} bytes are too small to hold the palettes at 0x{PALETTE_OFFSET:X}")
+    code[ENTRY_REGION_START:PALETTE_OFFSET] = bytes(PALETTE_OFFSET - ENTRY_REGION_START)
+
+    slot = ENTRY_REGION_START
+    data_end = 0
+    pointers = []
+    csv_rows = ["Hex off,Palette"]
+    made = []
+    for _ in range(tables):
+        variations = int(rng.integers(1, max_variations + 1))
+        if slot + (variations + 1) * ENTRY_SIZE > TABLE_OFFSET:
+            break
+        if made and rng.random() < 0.1:
+            # Now and then a table reuses an earlier ones pixels, as the game does for some objects
+            shapes = made[int(rng.integers(len(made)))]
+        else:
+            xsize, ysize = (int(v) for v in rng.integers(8, max_size + 1, size=2))
+            shapes = []
+            for _ in range(variations):
+                length = (xsize * ysize + 1) // 2
+                if data_end + length > len(sprites):
+                    break
+                sprites[data_end:data_end + length] = make_sprite(rng, xsize, ysize)
+                shapes.append((xsize, ysize, data_end))
+                data_end = (data_end + length + 3) & ~3  # data offsets are in 4 byte words
+                xsize, ysize = max(xsize * 3 // 4, 1), max(ysize * 3 // 4, 1)
+            if not shapes:
+                break
+            made.append(shapes)
+
+        palettes = rng.choice(PALETTE_LENGTH // 32, size=int(rng.integers(1, 4)), replace=False)
+        csv_rows.append(f"{slot:05X}," + ",".join(f"{int(p):02x}" for p in sorted(palettes)))
+        for xsize, ysize, data_offset in shapes:
+            bank, offset = divmod(data_offset // 4, 0x10000)
+            code[slot:slot + ENTRY_SIZE] = bytes([0, xsize, 0, ysize - 1, 0, 0, 0, bank, offset >> 8, offset & 0xFF])
+            pointers.append(slot)
+            slot += ENTRY_SIZE
+        slot += ENTRY_SIZE  # all zero terminator
+
+    if TABLE_OFFSET + (len(pointers) + 1) * POINTER_SIZE > PALETTE_OFFSET:
+        raise ValueError(f"{len(pointers)} sprites is too many for the pointer table")
+    for i, pointer in enumerate(pointers):
+        code[TABLE_OFFSET + i * POINTER_SIZE:TABLE_OFFSET + (i + 1) * POINTER_SIZE] = pointer.to_bytes(POINTER_SIZE, 'big')
+    # Bit 15 is unused in the palette words
+    words = rng.integers(0, 0x8000, size=PALETTE_LENGTH // 2, dtype=np.uint16).astype('>u2')
+    code[PALETTE_OFFSET:PALETTE_OFFSET + PALETTE_LENGTH] = words.tobytes()
+
+    roms = {}
+    for parts, data in ((CODE_PARTS, code), (SPRITE_PARTS, sprites)):
+        start = 0
+        for _, rom_names, byte_amount in parts:
+            part_length = len(data) // len(parts)
+            for name, rom in zip(rom_names, deinterleave(bytes(data[start:start + part_length]), len(rom_names), byte_amount)):
+                roms[name] = rom
+            start += part_length
+    print(f"Generated {len(csv_rows) - 1} sprite tables, {len(pointers)} sprites, {data_end} bytes of sprite data")
+    return roms, "\n".join(csv_rows) + "\n"
+
+def write_synthetic(output_dir, build=False, **options):
+    """Write the ROM files to <output_dir>/Rom and setup_table.csv, and with build the built binaries as well."""
+    roms, csv_text = generate(**options)
+    rom_dir = os.path.join(output_dir, 'Rom')
+    os.makedirs(rom_dir, exist_ok=True)
+    for name, data in roms.items():
+        with open(os.path.join(rom_dir, name), 'wb') as f:
+            f.write(data)
+    with open(os.path.join(output_dir, 'setup_table.csv'), 'w', newline='') as f:
+        f.write(csv_text)
+    if build:
+        outputs, _ = build_roms(rom_dir)
+        write_files(outputs, output_dir)
+    return rom_dir
+
+def main():
+    parser = argparse.ArgumentParser(description='Make a synthetic OutRun style ROM set and setup_table.csv, for running and timing the tools without the real ROMs')
+    parser.add_argument('output_dir', help='Folder for the Rom folder and setup_table.csv')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed, the same seed gives the same files (default: 1)')
+    parser.add_argument('--tables', type=int, default=150, help='Number of sprite tables / CSV rows (default: 150)')
+    parser.add_argument('--max-variations', type=int, default=6, help='Most scale variations in one table (default: 6)')
+    parser.add_argument('--max-size', type=int, default=96, help='Largest sprite width and height, up to 255 (default: 96)')
+    parser.add_argument('--code-rom-size', type=lambda x: int(x, 0), default=0x10000, help='Size of each code ROM (default: 0x10000)')
+    parser.add_argument('--sprite-rom-size', type=lambda x: int(x, 0), default=0x20000, help='Size of each sprite ROM (default: 0x20000)')
+    parser.add_argument('--build', action='store_true', help='Also write code.bin, all_sprites.bin and the palettes like build_roms.py')
+    args = parser.parse_args()
+
+    write_synthetic(args.output_dir, build=args.build, seed=args.seed, tables=args.tables, max_variations=args.max_variations,
+                    max_size=min(args.max_size, 255), code_rom_size=args.code_rom_size, sprite_rom_size=args.sprite_rom_size)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except IOError:
+        return ImageFont.load_default()
+
+class LabelRenderer:
+    """Text labels built from cached glyph masks, for the atlas overlay and the palette sheet.
+
+    Each character is rendered once, and each distinct label string is composed once, so repeated
+    labels like the palette numbers cost only a paste.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+        self.masks = {}
+        self.labels = {}
+
+    def glyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            bbox = self.font.getbbox(char)
+            mask = Image.new('L', (max(bbox[2], 1), max(bbox[3], 1)), 0)
+            ImageDraw.Draw(mask).text((0, 0), char, font=self.font, fill=255)
+            glyph = (mask, self.font.getlength(char))
+            self.glyphs[char] = glyph
+        return glyph
+
+    def width(self, text):
+        """Width of the drawn text, for centring it."""
+        bbox = self.font.getbbox(text)
+        return bbox[2] - bbox[0]
+
+    def mask(self, text):
+        """'L' mask of the text with its origin at (1, 1), the one pixel border leaves room for an outline."""
+        mask = self.masks.get(text)
+        if mask is None:
+            bbox = self.font.getbbox(text)
+            mask = Image.new('L', (bbox[2] + 2, bbox[3] + 2), 0)
+            x = 0.0
+            for char in text:
+                glyph, advance = self.glyph(char)
+                pos = (1 + round(x), 1)
+                mask.paste(ImageChops.lighter(mask.crop(pos + (pos[0] + glyph.width, pos[1] + glyph.height)), glyph), pos)
+                x += advance
+            self.masks[text] = mask
+        return mask
+
+    def label(self, text):
+        """White text with a black outline, returns the label image, with its text origin at (1, 1), and the text width."""
+        label = self.labels.get(text)
+        if label is None:
+            text_mask = self.mask(text)
+            # The outline is the text grown by one pixel all round, the same as drawing it at the eight offsets
+            img = Image.new('RGBA', text_mask.size, (0, 0, 0, 0))
+            img.putalpha(text_mask.filter(ImageFilter.MaxFilter(3)))
+            img.paste((255, 255, 255, 255), (0, 0), text_mask)
+            label = (img, self.width(text))
+            self.labels[text] = label
+        return label
+
+    def paste(self, img, xy, text, fill=(0, 0, 0)):
+        """Plain text in one colour with its origin at xy."""
+        img.paste(fill, (xy[0] - 1, xy[1] - 1), self.mask(text))